@@ -0,0 +1,49 @@
+import time
+from PyQt6.QtCore import Qt, QTimer
+
+class AnimationClock:
+    """所有宠物共用的一个定时器
+
+    每个回调有自己的间隔和下次到期时间，定时器只在最早到期的时刻触发一次，
+    同时到期的回调在同一次触发中执行。宠物数量增加时不会增加定时器。
+    """
+    def __init__(self, tolerance_ms=2):
+        self.timer = None  # 第一次订阅时创建（需要先有 QApplication）
+        self.tolerance = tolerance_ms / 1000
+        self.subscribers = {}  # 回调 -> [间隔(秒), 下次到期时间]
+        self.ticks = 0  # 累计执行的回调次数
+
+    def subscribe(self, callback, interval_ms):
+        """按间隔重复调用 callback；已订阅时更新间隔并重新计时"""
+        self.subscribers[callback] = [interval_ms / 1000, time.perf_counter() + interval_ms / 1000]
+        self._schedule()
+
+    def unsubscribe(self, callback):
+        self.subscribers.pop(callback, None)
+
+    def _tick(self):
+        now = time.perf_counter()
+        for callback, entry in list(self.subscribers.items()):
+            interval, due = entry
+            # 前面的回调可能已重新订阅或取消了它
+            if self.subscribers.get(callback) is not entry or due > now + self.tolerance:
+                continue
+            # 落后超过一个间隔时不补帧，从现在重新计时
+            entry[1] = due + interval if due + interval > now else now + interval
+            self.ticks += 1
+            callback()
+        self._schedule()
+
+    def _schedule(self):
+        if not self.subscribers:
+            return
+        if self.timer is None:
+            self.timer = QTimer()
+            self.timer.setSingleShot(True)
+            self.timer.setTimerType(Qt.TimerType.PreciseTimer)
+            self.timer.timeout.connect(self._tick)
+        delay = min(due for _, due in self.subscribers.values()) - time.perf_counter()
+        self.timer.start(max(0, int(delay * 1000)))
+
+# 全局共享的动画时钟
+clock = AnimationClock()
@@ -0,0 +1,106 @@
+import wave
+import numpy as np
+
+FRAME_MS = 20  # 能量计算的帧长
+SILENCE_DB = -50  # 整段峰值能量低于此值时视为没有说话
+VOICE_DB = SILENCE_DB + 10  # 能量高于此值的帧总算作有声，不受自适应阈值影响
+
+def read_wav(path):
+    """读取16位PCM WAV，返回 ([-1, 1] 的 float32 单声道样本, 采样率)"""
+    with wave.open(path, 'rb') as wf:
+        rate = wf.getframerate()
+        channels = wf.getnchannels()
+        width = wf.getsampwidth()
+        data = wf.readframes(wf.getnframes())
+    if width != 2:
+        raise ValueError(f"只支持16位PCM: {path}")
+    samples = np.frombuffer(data, dtype='<i2').astype(np.float32) / 32768
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    return samples, rate
+
+def write_wav(path, samples, rate):
+    """写入16位单声道WAV"""
+    pcm = (np.clip(samples, -1, 1) * 32767).astype('<i2')
+    with wave.open(path, 'wb') as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(rate)
+        wf.writeframes(pcm.tobytes())
+
+def frame_energy_db(samples, frame_len):
+    """每帧的RMS能量(dBFS)"""
+    count = len(samples) // frame_len
+    frames = samples[:count * frame_len].reshape(count, frame_len)
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    return 20 * np.log10(rms + 1e-10)
+
+def find_segments(energy_db, min_pause_frames, min_voice_frames, pad_frames):
+    """按帧能量找出有声段，返回帧区间 [(开始, 结束)]
+
+    阈值随录音自适应：取噪声底（10%分位）以上10dB与峰值以下35dB中较高者。
+    剪得很紧、几乎没有静音的录音里10%分位落在轻声说话上，因此阈值不超过 VOICE_DB。
+    间隔不超过 min_pause_frames 的有声帧算作同一段。
+    """
+    if len(energy_db) == 0 or energy_db.max() < SILENCE_DB:
+        return []
+    threshold = min(max(np.percentile(energy_db, 10) + 10, energy_db.max() - 35), VOICE_DB)
+    voiced = np.flatnonzero(energy_db > threshold)
+    if voiced.size == 0:
+        return []  # 能量几乎恒定时没有帧高于阈值
+    breaks = np.flatnonzero(np.diff(voiced) > min_pause_frames)
+    starts = voiced[np.r_[0, breaks + 1]]
+    ends = voiced[np.r_[breaks, len(voiced) - 1]] + 1
+
+    segments = []
+    for start, end in zip(starts, ends):
+        if end - start < min_voice_frames:
+            continue  # 过短的是咔哒声等噪声
+        segments.append((max(0, start - pad_frames), min(len(energy_db), end + pad_frames)))
+    return segments
+
+def loudness_gain(samples, target_db=-20, max_gain_db=20):
+    """把RMS响度调整到 target_db 所需的增益，同时保证峰值不削波"""
+    rms = np.sqrt(np.mean(samples * samples))
+    peak = np.abs(samples).max()
+    if rms <= 0 or peak <= 0:
+        return 1.0
+    gain = min(10 ** ((target_db - 20 * np.log10(rms)) / 20), 10 ** (max_gain_db / 20))
+    return min(gain, 0.99 / peak)
+
+def preprocess(samples, rate, min_pause_ms=700, split_min_seconds=8.0, pad_ms=150, min_voice_ms=100, gap_ms=200):
+    """去直流、裁掉静音、响度归一化，并在长停顿处切段
+
+    返回 (片段列表, 统计信息)。总时长不足 split_min_seconds 时，切段后并行识别的收益
+    抵不过每个 whisper 进程的启动开销，此时把各段用 gap_ms 的短静音拼成一段。
+    """
+    original_seconds = len(samples) / rate
+    if len(samples) == 0:
+        # 轻点一下按钮时录音可能是空的
+        return [], {"original_seconds": 0.0, "processed_seconds": 0.0, "saved_seconds": 0.0,
+                    "segments": 0, "gain_db": 0.0}
+    samples = samples - samples.mean()
+    frame_len = rate * FRAME_MS // 1000
+    segments = find_segments(frame_energy_db(samples, frame_len),
+                             min_pause_ms // FRAME_MS, min_voice_ms // FRAME_MS, pad_ms // FRAME_MS)
+    pieces = [samples[start * frame_len:end * frame_len] for start, end in segments]
+
+    gain = 1.0
+    if pieces:
+        gain = loudness_gain(np.concatenate(pieces))
+        pieces = [piece * gain for piece in pieces]
+        if len(pieces) > 1 and sum(len(p) for p in pieces) / rate < split_min_seconds:
+            gap = np.zeros(rate * gap_ms // 1000, dtype=samples.dtype)
+            joined = [pieces[0]]
+            for piece in pieces[1:]:
+                joined.extend((gap, piece))
+            pieces = [np.concatenate(joined)]
+
+    processed_seconds = sum(len(p) for p in pieces) / rate
+    return pieces, {
+        "original_seconds": original_seconds,
+        "processed_seconds": processed_seconds,
+        "saved_seconds": original_seconds - processed_seconds,
+        "segments": len(pieces),
+        "gain_db": float(20 * np.log10(gain)),
+    }
@@ -0,0 +1,101 @@
+"""多宠物压力测试：不同宠物数量下的CPU占用和内存
+
+每个数量在独立的子进程中运行（默认使用 offscreen 平台，无需显示器），
+宠物共用动画帧和动画时钟，理想情况下每多一只宠物只增加几十KB。
+
+用法: python benchmarks/bench_pets.py [--counts 1 10 50] [--seconds 10] [--skin teddy]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from process_stats import rss_bytes
+
+def run_child(count, seconds, skin):
+    """在当前进程中创建 count 只宠物并运行 seconds 秒，输出一行JSON"""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt6.QtWidgets import QApplication
+    from PyQt6.QtCore import QTimer
+    app = QApplication(sys.argv[:1])
+    from desktop_pet import DesktopPet
+    from sprite_repository import sprites
+    from animation_clock import clock
+
+    rss_base = rss_bytes()
+    start = time.perf_counter()
+    main_pet = DesktopPet(skin=skin, load_model=False)
+    main_pet.loadRemainingAnimations()
+    main_pet.show()
+    rss_first = rss_bytes()
+    pets = [main_pet]
+    for _ in range(count - 1):
+        pet = DesktopPet(skin=skin, owner=main_pet)
+        pet.show()
+        pets.append(pet)
+    app.processEvents()
+    startup_ms = (time.perf_counter() - start) * 1000
+    rss_all = rss_bytes()
+
+    # 运行一段时间，统计CPU时间和时钟回调次数
+    ticks = clock.ticks
+    cpu = time.process_time()
+    wall = time.perf_counter()
+    QTimer.singleShot(int(seconds * 1000), app.quit)
+    app.exec()
+    wall = time.perf_counter() - wall
+    cpu = time.process_time() - cpu
+
+    print(json.dumps({
+        "pets": count,
+        "startup_ms": startup_ms,
+        "cpu_percent": cpu / wall * 100,
+        "callbacks_per_sec": (clock.ticks - ticks) / wall,
+        "sprite_mb": sprites.memory_bytes() / 1024 / 1024,
+        "rss_mb": rss_all / 1024 / 1024,
+        "first_pet_mb": (rss_first - rss_base) / 1024 / 1024,
+        "per_extra_pet_kb": (rss_all - rss_first) / 1024 / (count - 1) if count > 1 else 0.0,
+    }))
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description="多宠物压力测试")
+    parser.add_argument("--counts", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--skin", default="teddy")
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--child", type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # 素材使用相对路径
+    os.chdir(ROOT)
+    if args.child:
+        return run_child(args.child, args.seconds, args.skin)
+
+    results = []
+    for count in args.counts:
+        result = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", str(count),
+                                 "--seconds", str(args.seconds), "--skin", args.skin],
+                                capture_output=True, text=True, cwd=ROOT)
+        lines = result.stdout.strip().splitlines()
+        if result.returncode != 0 or not lines:
+            print(f"[{count}] 运行失败: {result.stderr.strip()[-500:]}")
+            continue
+        stats = json.loads(lines[-1])
+        results.append(stats)
+        print(f"[{count:>3} 只] CPU {stats['cpu_percent']:.1f}%, RSS {stats['rss_mb']:.1f}MB, "
+              f"动画帧 {stats['sprite_mb']:.1f}MB, 每多一只 {stats['per_extra_pet_kb']:.0f}KB, "
+              f"启动 {stats['startup_ms']:.0f}ms")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
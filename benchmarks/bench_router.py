@@ -0,0 +1,105 @@
+"""对比小模型与大模型路由的延迟和质量代理指标
+
+用法: python benchmarks/bench_router.py [--output router_bench.json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llama_chat_manager import LlamaChatManager
+from response_cache import ResponseCache
+
+PROMPTS = [
+    "你好呀",
+    "早上好",
+    "你叫什么名字",
+    "讲个笑话",
+    "我有点累了",
+    "晚安",
+    "今天好开心",
+    "我考试没考好，好难过",
+    "为什么天空是蓝色的？",
+    "帮我想一个周末出去玩的计划",
+]
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+def bigram_jaccard(a, b):
+    """回复之间的字符二元组相似度，用大模型的回复作参照"""
+    a, b = ResponseCache.normalize(a), ResponseCache.normalize(b)
+    sa = {a[i:i + 2] for i in range(len(a) - 1)}
+    sb = {b[i:i + 2] for i in range(len(b) - 1)}
+    if not sa or not sb:
+        return 0.0
+    return len(sa & sb) / len(sa | sb)
+
+def run(manager, prompts, rounds):
+    results = {}
+    for route in ("small", "large"):
+        latencies, confidences, parsed, replies = [], [], 0, {}
+        for _ in range(rounds):
+            for prompt in prompts:
+                messages = manager.format_prompt(prompt)
+                start = time.perf_counter()
+                content, confidence = manager.generate(messages, route)
+                latencies.append(time.perf_counter() - start)
+                confidences.append(confidence)
+                try:
+                    json.loads(content)
+                    parsed += 1
+                except ValueError:
+                    pass
+                replies.setdefault(prompt, manager.parse_reply(content).text)
+        results[route] = {
+            "latency_p50": percentile(latencies, 50),
+            "latency_p95": percentile(latencies, 95),
+            "mean_confidence": sum(confidences) / len(confidences),
+            "json_ok_rate": parsed / len(latencies),
+            "replies": replies,
+        }
+
+    # 质量代理：小模型回复与大模型回复的相似度
+    small, large = results["small"]["replies"], results["large"]["replies"]
+    results["small"]["similarity_to_large"] = sum(
+        bigram_jaccard(small[p], large[p]) for p in prompts) / len(prompts)
+
+    # 按当前路由规则实际会走小模型的比例
+    results["routed_small_rate"] = sum(
+        1 for p in prompts if manager.router.route(p) == "small") / len(prompts)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="模型路由基准测试")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    manager = LlamaChatManager(use_cache=False, persist=False)
+    if not manager.small_model:
+        print("未找到小模型，无法对比路由")
+        return 1
+
+    results = run(manager, PROMPTS, args.rounds)
+    for route in ("small", "large"):
+        r = results[route]
+        print(f"[{route}] p50={r['latency_p50']:.2f}s p95={r['latency_p95']:.2f}s "
+              f"置信度={r['mean_confidence']:.2f} JSON成功率={r['json_ok_rate']:.0%}")
+    print(f"小模型与大模型回复相似度: {results['small']['similarity_to_large']:.2f}")
+    print(f"路由到小模型的比例: {results['routed_small_rate']:.0%}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+"""对比普通解码与投机解码的生成速度
+
+用法: python benchmarks/bench_speculative.py [--modes none prompt_lookup draft]
+"""
+import os
+import sys
+import gc
+import json
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llama_chat_manager import LlamaChatManager
+
+# 宠物经常复述主人的话，这类输入最能体现 prompt lookup 的效果
+PROMPTS = [
+    "我今天去公园散步了，看到了好多小鸭子在湖里游泳",
+    "我明天要考数学和英语，有点紧张",
+    "给我讲一个关于小熊和蜂蜜的故事",
+    "我的猫咪今天把花瓶打碎了",
+    "周末想去海边看日出，你觉得怎么样",
+]
+
+def run_mode(mode, rounds):
+    manager = LlamaChatManager(use_cache=False, persist=False, speculative=mode)
+    for _ in range(rounds):
+        for prompt in PROMPTS:
+            # 强制走大模型，排除路由的影响
+            manager.generate(manager.format_prompt(prompt), "large")
+    stats = manager.decode_stats()
+    del manager
+    gc.collect()
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="投机解码基准测试")
+    parser.add_argument("--modes", nargs="+", default=["none", "prompt_lookup", "draft"])
+    parser.add_argument("--rounds", type=int, default=2)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    results = {}
+    for mode in args.modes:
+        try:
+            results[mode] = run_mode(mode, args.rounds)
+        except ValueError as e:
+            print(f"跳过 {mode}: {e}")
+            continue
+        stats = results[mode]
+        line = f"[{mode}] {stats['avg_tokens_per_sec']:.1f} tokens/s"
+        if "acceptance_rate" in stats:
+            line += f", 接受率 {stats['acceptance_rate']:.0%}"
+        if "none" in results and mode != "none" and results["none"]["avg_tokens_per_sec"]:
+            line += f", 加速比 {stats['avg_tokens_per_sec'] / results['none']['avg_tokens_per_sec']:.2f}x"
+        print(line)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
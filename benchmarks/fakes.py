@@ -0,0 +1,141 @@
+"""离线基准测试用的替身：假的 llama-server 和不依赖外部程序的语音管理器
+
+替身按固定的速率模拟耗时，结果可复现，适合在没有模型的CI上检测管线本身的开销。
+"""
+import os
+import sys
+import json
+import time
+import wave
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from voice_chat_manager import VoiceChatManager
+
+FAKE_REPLY = "*摇摇尾巴* 主人好呀，今天也要开开心心的哦～"
+
+class FakeLlamaHandler(BaseHTTPRequestHandler):
+    """实现 llama-server 的 /health、/tokenize、/v1/chat/completions、/v1/completions 子集"""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, data):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json({"status": "ok"})
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length).decode("utf-8"))
+        server = self.server
+
+        if self.path == "/tokenize":
+            # 与流式输出一致：每两个字符算一个token
+            content = request.get("content", "")
+            self._send_json({"tokens": list(range((len(content) + 1) // 2))})
+            return
+        if self.path == "/v1/completions":
+            time.sleep(server.prefill_s_per_char * len(request.get("prompt", "")))
+            self._send_json({"choices": [{"text": "好"}], "usage": {"completion_tokens": 1}})
+            return
+        if self.path != "/v1/chat/completions":
+            self.send_error(404)
+            return
+
+        # 模拟预填充：耗时与提示长度成正比
+        prompt_chars = sum(len(m["content"]) for m in request["messages"])
+        time.sleep(server.prefill_s_per_char * prompt_chars)
+
+        content = json.dumps({"text": FAKE_REPLY, "action": "none"}, ensure_ascii=False)
+        tokens = [content[i:i + 2] for i in range(0, len(content), 2)]
+
+        if not request.get("stream"):
+            time.sleep(server.decode_s_per_token * len(tokens))
+            self._send_json({
+                "choices": [{"message": {"role": "assistant", "content": content}}],
+                "usage": {"completion_tokens": len(tokens)},
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for token in tokens:
+            time.sleep(server.decode_s_per_token)
+            chunk = {"choices": [{"delta": {"content": token}}]}
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+class FakeLlamaServer:
+    """在后台线程运行的假推理服务"""
+    def __init__(self, prefill_ms_per_char=0.05, decode_ms_per_token=2.0):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), FakeLlamaHandler)
+        self.httpd.prefill_s_per_char = prefill_ms_per_char / 1000
+        self.httpd.decode_s_per_token = decode_ms_per_token / 1000
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+def wav_duration(path):
+    with wave.open(path, 'rb') as wf:
+        return wf.getnframes() / wf.getframerate()
+
+class FakeVoiceChatManager(VoiceChatManager):
+    """语音识别和合成的替身：按音频/文本长度模拟耗时"""
+    def __init__(self, stt_realtime_factor=0.05, tts_ms_per_char=5.0, scratch=None):
+        super().__init__(scratch)
+        self.stt_realtime_factor = stt_realtime_factor
+        self.tts_ms_per_char = tts_ms_per_char
+
+    def speech_to_text(self, audio_file):
+        """走真实的预处理和分段流程，识别结果读取与录音同名的 .txt"""
+        super().speech_to_text(audio_file)
+        transcript = os.path.splitext(audio_file)[0] + ".txt"
+        if os.path.exists(transcript):
+            with open(transcript, 'r', encoding='utf-8') as f:
+                return f.read().strip()
+        return "你好"
+
+    def _transcribe(self, audio_file):
+        """按音频时长模拟 whisper 的耗时"""
+        time.sleep(wav_duration(audio_file) * self.stt_realtime_factor)
+        return "你好"
+
+    def text_to_speech(self, text, output_file=None):
+        """写入与文本长度相当的静音WAV"""
+        time.sleep(len(text) * self.tts_ms_per_char / 1000)
+        output_file = output_file or self.scratch.path("fake_speech", ".wav")
+        with wave.open(output_file, 'wb') as wf:
+            wf.setnchannels(1)
+            wf.setsampwidth(2)
+            wf.setframerate(16000)
+            wf.writeframes(b"\0\0" * int(16000 * 0.2 * len(text)))
+        return output_file
@@ -0,0 +1,327 @@
+"""宠物管线的可复现基准测试：聊天生成、语音识别/合成、宠物启动与动画加载
+
+默认使用 fakes.py 中的替身（假 llama-server、模拟耗时的语音管理器），无需模型即可在CI上运行；
+加 --real 则使用真实模型、whisper.cpp 和 edge-tts。
+
+录音样本放在 benchmarks/fixtures/*.wav（16kHz 单声道），同名 .txt 为参考文本；
+目录为空时在 cache/bench_fixtures 下生成固定随机种子的合成样本。
+
+用法:
+  python benchmarks/run_benchmarks.py [--real] [--rounds 3] [--output report.json]
+  python benchmarks/run_benchmarks.py --save-baseline benchmarks/baseline.json
+  python benchmarks/run_benchmarks.py --baseline benchmarks/baseline.json [--tolerance 0.1]
+"""
+import os
+import sys
+import json
+import time
+import wave
+import platform
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from process_stats import rss_bytes
+from tracing import tracer, percentile
+
+FIXTURE_DIR = os.path.join(ROOT, "benchmarks", "fixtures")
+# 合成样本可随时重新生成，放在不纳入版本管理的缓存目录
+SYNTHETIC_DIR = os.path.join(ROOT, "cache", "bench_fixtures")
+
+PROMPTS = [
+    "你好呀",
+    "我今天去公园散步了，看到了好多小鸭子在湖里游泳",
+    "给我讲一个关于小熊和蜂蜜的故事",
+    "我明天要考数学和英语，有点紧张",
+    "周末想去海边看日出，你觉得怎么样",
+]
+
+# 合成样本：(文件名, 参考文本, 有声段时长列表)，段间插入停顿
+SYNTHETIC_FIXTURES = [
+    ("short", "你好", [0.8]),
+    ("medium", "今天天气怎么样", [1.2, 0.9]),
+    ("long", "给我讲一个关于小熊和蜂蜜的故事吧", [1.5, 2.0, 1.2]),
+]
+
+# 数值越大越好的指标，其余按耗时/内存处理（越小越好）
+HIGHER_IS_BETTER = ("tps", "speedup", "saved")
+# 只是描述工作量的字段，不参与对比
+NOT_COMPARED = ("count", "frames", "audio_seconds", "tokens", "errors")
+
+def summarize(values):
+    """延迟分布摘要"""
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values) if values else 0.0,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+    }
+
+def mb(value):
+    return value / (1024 * 1024)
+
+def write_synthetic_fixture(path, segments, rate=16000, seed=0):
+    """生成类似语音的合成样本：调幅的多谐波音段 + 首尾和段间静音"""
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    pieces = [np.zeros(int(0.4 * rate))]
+    for duration in segments:
+        t = np.arange(int(duration * rate)) / rate
+        pitch = 180 + 40 * np.sin(2 * np.pi * 0.7 * t)
+        phase = 2 * np.pi * np.cumsum(pitch) / rate
+        voice = sum(np.sin(k * phase) / k for k in range(1, 5))
+        envelope = 0.5 * (1 - np.cos(2 * np.pi * 4 * t)) * np.hanning(len(t))
+        pieces.append(0.3 * voice * envelope + 0.01 * rng.standard_normal(len(t)))
+        pieces.append(np.zeros(int(0.6 * rate)))
+    samples = (np.clip(np.concatenate(pieces), -1, 1) * 32767).astype(np.int16)
+    with wave.open(path, 'wb') as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(rate)
+        wf.writeframes(samples.tobytes())
+
+def load_fixtures(folder=FIXTURE_DIR):
+    """返回 [(wav路径, 参考文本)]，没有录音样本时生成合成样本"""
+    wavs = sorted(f for f in os.listdir(folder) if f.endswith(".wav")) if os.path.isdir(folder) else []
+    if not wavs:
+        print(f"{folder} 中没有录音样本，在 {SYNTHETIC_DIR} 生成合成样本")
+        folder = SYNTHETIC_DIR
+        os.makedirs(folder, exist_ok=True)
+        for seed, (name, text, segments) in enumerate(SYNTHETIC_FIXTURES):
+            write_synthetic_fixture(os.path.join(folder, f"{name}.wav"), segments, seed=seed)
+            with open(os.path.join(folder, f"{name}.txt"), 'w', encoding='utf-8') as f:
+                f.write(text)
+        wavs = sorted(f"{name}.wav" for name, _, _ in SYNTHETIC_FIXTURES)
+
+    fixtures = []
+    for name in wavs:
+        path = os.path.join(folder, name)
+        transcript = os.path.splitext(path)[0] + ".txt"
+        text = None
+        if os.path.exists(transcript):
+            with open(transcript, 'r', encoding='utf-8') as f:
+                text = f.read().strip()
+        fixtures.append((path, text))
+    return fixtures
+
+def bench_chat(args):
+    """聊天生成：启动耗时、每轮延迟、首token延迟和解码速度"""
+    from llama_chat_manager import LlamaChatManager
+
+    def run(server):
+        rss_before = rss_bytes()
+        start = time.perf_counter()
+        manager = LlamaChatManager(use_cache=False, persist=False, memory=False, server=server)
+        manager.warm_up()
+        startup_ms = (time.perf_counter() - start) * 1000
+
+        tracer.turns.clear()
+        for _ in range(args.rounds):
+            for prompt in PROMPTS:
+                manager.process_input(prompt)
+        records = tracer.snapshot()
+        return {
+            "startup_ms": startup_ms,
+            "latency_ms": summarize([r["total_ms"] for r in records]),
+            "ttft_ms": summarize([r["metrics"]["ttft_ms"] for r in records if "ttft_ms" in r["metrics"]]),
+            "decode_tps": summarize([r["metrics"]["decode_tps"] for r in records if "decode_tps" in r["metrics"]]),
+            "tokens": sum(r["metrics"].get("tokens", 0) for r in records),
+            "errors": sum(1 for r in records if "error" in r["metrics"]),
+            "rss_delta_mb": mb(rss_bytes() - rss_before),
+        }
+
+    if args.real:
+        # 由 llama_config.json 决定本地加载还是连接聊天服务
+        return run(None)
+
+    from fakes import FakeLlamaServer
+    with FakeLlamaServer(args.fake_prefill_ms, args.fake_decode_ms) as server:
+        return run(server.url)
+
+def bench_voice(args, fixtures):
+    """语音识别和语音合成的延迟"""
+    from fakes import FakeVoiceChatManager, wav_duration
+    from voice_chat_manager import VoiceChatManager
+
+    manager = VoiceChatManager() if args.real else FakeVoiceChatManager()
+    stt_ms, realtime_factors, saved_seconds, mismatches = [], [], [], 0
+    audio_seconds = 0.0
+    for _ in range(args.rounds):
+        for path, expected in fixtures:
+            duration = wav_duration(path)
+            start = time.perf_counter()
+            text = manager.speech_to_text(path)
+            elapsed = time.perf_counter() - start
+            stt_ms.append(elapsed * 1000)
+            saved_seconds.append(manager.last_audio_saved_seconds)
+            realtime_factors.append(elapsed / duration if duration else 0.0)
+            audio_seconds += duration
+            if expected is not None and text != expected:
+                mismatches += 1
+
+    tts_ms = []
+    texts = [text for _, text in fixtures if text] or PROMPTS
+    for _ in range(args.rounds):
+        for text in texts:
+            start = time.perf_counter()
+            output = manager.text_to_speech(text)
+            tts_ms.append((time.perf_counter() - start) * 1000)
+            manager.scratch.release(output)
+
+    return {
+        "stt_ms": summarize(stt_ms),
+        "stt_realtime_factor": summarize(realtime_factors),
+        "stt_errors": mismatches,
+        "audio_saved_s": summarize(saved_seconds),
+        "tts_ms": summarize(tts_ms),
+        "audio_seconds": audio_seconds,
+    }
+
+def pet_child():
+    """在子进程中测量宠物启动，输出一行JSON"""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    start = time.perf_counter()
+    from PyQt6.QtWidgets import QApplication
+    import desktop_pet
+    import_ms = (time.perf_counter() - start) * 1000
+
+    app = QApplication(sys.argv)
+    start = time.perf_counter()
+    # panda 皮肤的素材不随仓库分发，使用 teddy；不加载聊天模型，只测宠物本身
+    pet = desktop_pet.DesktopPet(skin='teddy', load_model=False)
+    first_frame_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    pet.loadRemainingAnimations()
+    remaining_ms = (time.perf_counter() - start) * 1000
+
+    pixmaps = [p for frames in pet.animations.values() for p in frames]
+    if not pixmaps:
+        print("没有加载到任何动画帧", file=sys.stderr)
+        return 1
+    print(json.dumps({
+        "import_ms": import_ms,
+        "first_frame_ms": first_frame_ms,
+        "load_animations_ms": remaining_ms,
+        "frames": len(pixmaps),
+        "pixmap_mb": mb(sum(p.width() * p.height() * p.depth() // 8 for p in pixmaps)),
+        "rss_mb": mb(rss_bytes()),
+    }))
+    return 0
+
+def bench_pet(args):
+    """宠物从进程启动到显示首帧、加载全部动画的耗时（每轮一个新进程）"""
+    runs = []
+    for _ in range(args.rounds):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, os.path.abspath(__file__), "--pet-child"],
+                                capture_output=True, text=True, cwd=ROOT)
+        wall_ms = (time.perf_counter() - start) * 1000
+        lines = result.stdout.strip().splitlines()
+        if result.returncode != 0 or not lines:
+            raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "子进程无输出")
+        data = json.loads(lines[-1])
+        data["process_ms"] = wall_ms
+        runs.append(data)
+
+    report = {name: summarize([run[name] for run in runs])
+              for name in ("process_ms", "import_ms", "first_frame_ms", "load_animations_ms", "rss_mb")}
+    report["frames"] = runs[-1]["frames"]
+    report["pixmap_mb"] = runs[-1]["pixmap_mb"]
+    return report
+
+def flatten(data, prefix=""):
+    """把嵌套的报告展开为 {"chat.latency_ms.p50": 值}"""
+    items = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            items.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            items[name] = value
+    return items
+
+def compare(report, baseline, tolerance=0.1):
+    """与基线对比，返回退化超过容差的指标列表"""
+    current = flatten({k: v for k, v in report.items() if k != "meta"})
+    previous = flatten({k: v for k, v in baseline.items() if k != "meta"})
+    regressions = []
+    print(f"\n{'指标':<40}{'基线':>12}{'本次':>12}{'变化':>10}")
+    for name in sorted(current):
+        if name not in previous or name.split(".")[-1] in NOT_COMPARED:
+            continue
+        old, new = previous[name], current[name]
+        if not old:
+            continue
+        change = (new - old) / abs(old)
+        higher_is_better = any(word in name for word in HIGHER_IS_BETTER)
+        worse = -change if higher_is_better else change
+        flag = ""
+        if worse > tolerance:
+            flag = " !"
+            regressions.append({"metric": name, "baseline": old, "current": new, "change": change})
+        print(f"{name:<40}{old:>12.2f}{new:>12.2f}{change:>+9.0%}{flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="宠物管线基准测试")
+    parser.add_argument("--real", action="store_true", help="使用真实模型和语音工具")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--only", nargs="+", choices=["chat", "voice", "pet"], default=["chat", "voice", "pet"])
+    parser.add_argument("--fixtures", default=FIXTURE_DIR)
+    parser.add_argument("--fake-prefill-ms", type=float, default=0.05, help="假服务每字符的预填充耗时")
+    parser.add_argument("--fake-decode-ms", type=float, default=2.0, help="假服务每token的解码耗时")
+    parser.add_argument("--output", default=None, help="报告路径，默认 logs/bench_<时间>.json")
+    parser.add_argument("--baseline", default=None, help="与该基线报告对比，退化时返回非零")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="允许的退化比例")
+    parser.add_argument("--save-baseline", default=None, help="把本次报告保存为基线")
+    parser.add_argument("--pet-child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # 模型、素材和临时目录都是相对路径
+    os.chdir(ROOT)
+    if args.pet_child:
+        return pet_child()
+
+    report = {"meta": {
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "mode": "real" if args.real else "fake",
+        "rounds": args.rounds,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+    }}
+    sections = {
+        "chat": lambda: bench_chat(args),
+        "voice": lambda: bench_voice(args, load_fixtures(args.fixtures)),
+        "pet": lambda: bench_pet(args),
+    }
+    for name in args.only:
+        print(f"== {name} ==")
+        try:
+            report[name] = sections[name]()
+        except (ImportError, RuntimeError, OSError) as e:
+            # 缺少依赖（如 PyQt6、llama_cpp）时跳过该项
+            print(f"跳过 {name}: {e}")
+            report[name] = {"skipped": str(e)}
+    report["rss_mb"] = mb(rss_bytes())
+
+    output = args.output or os.path.join("logs", f"bench_{time.strftime('%Y%m%d%H%M%S')}.json")
+    for path in filter(None, (output, args.save_baseline)):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"报告已保存到 {output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} 项指标退化超过 {args.tolerance:.0%}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,175 @@
+"""本地推理服务：由 llama.cpp 的 llama-server 持有模型，多个前端共享
+
+llama-server 提供 OpenAI 兼容接口（/v1/chat/completions 等），用 --parallel
+开启多个槽位并连续批处理，多个会话的请求会在同一个模型实例里合并解码。
+
+用法:
+    python chat_server.py              启动服务（参数来自 llama_config.json）
+    python chat_server.py --parallel 4 --port 8080
+"""
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import subprocess
+import urllib.request
+import urllib.error
+from llama_runtime import DEFAULT_CONFIG_FILE, KV_CACHE_TYPES, load_runtime_config, llama_kwargs
+
+DEFAULT_SERVER = {
+    "enabled": False,   # 为True时 LlamaChatManager 作为客户端连接服务
+    "binary": "llama.cpp/llama-server.exe" if os.name == 'nt' else "llama.cpp/llama-server",
+    "model_path": "models/Llama3-q4_k_m-v1.gguf",
+    "draft_model_path": None,  # 服务端投机解码的草稿模型
+    "host": "127.0.0.1",
+    "port": 8080,
+    "parallel": 4,      # 并行槽位数，每个槽位有独立的上下文
+}
+
+def load_server_config(config_file=DEFAULT_CONFIG_FILE):
+    """读取服务配置并与默认值合并"""
+    config = dict(DEFAULT_SERVER)
+    if os.path.exists(config_file):
+        try:
+            with open(config_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            config.update({k: v for k, v in data.get("server", {}).items() if k in DEFAULT_SERVER})
+        except Exception as e:
+            print(f"读取服务配置出错: {e}")
+    return config
+
+def server_url(config):
+    return f"http://{config['host']}:{config['port']}"
+
+class ChatServerClient:
+    """llama-server 的轻量客户端，接口与 Llama.create_chat_completion 保持一致"""
+    def __init__(self, url, timeout=300):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def _post(self, path, body):
+        request = urllib.request.Request(
+            f"{self.url}{path}",
+            data=json.dumps(body, ensure_ascii=False).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        return urllib.request.urlopen(request, timeout=self.timeout)
+
+    def _stream(self, response):
+        """解析 SSE 流，逐块返回 chunk"""
+        with response:
+            for line in response:
+                line = line.decode("utf-8").strip()
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                yield json.loads(data)
+
+    def create_chat_completion(self, messages, temperature=0.7, top_p=0.9, max_tokens=512,
+                               grammar=None, stream=False, **kwargs):
+        """调用 /v1/chat/completions；本地专用参数（如 logits_processor）会被忽略"""
+        body = {
+            "messages": messages,
+            "temperature": temperature,
+            "top_p": top_p,
+            "max_tokens": max_tokens,
+            "stream": stream,
+            "cache_prompt": True,  # 复用槽位里相同前缀的KV缓存
+        }
+        if grammar is not None:
+            body["grammar"] = grammar if isinstance(grammar, str) else str(grammar)
+        response = self._post("/v1/chat/completions", body)
+        if stream:
+            return self._stream(response)
+        with response:
+            return json.loads(response.read().decode("utf-8"))
+
+    def create_completion(self, prompt, max_tokens=16, **kwargs):
+        """调用 /v1/completions"""
+        with self._post("/v1/completions", {"prompt": prompt, "max_tokens": max_tokens}) as response:
+            return json.loads(response.read().decode("utf-8"))
+
+    def tokenize(self, text, add_bos=False, special=True):
+        """调用 /tokenize，参数与 Llama.tokenize 一致（text 为 UTF-8 字节）"""
+        if isinstance(text, bytes):
+            text = text.decode("utf-8", errors="ignore")
+        body = {"content": text, "add_special": add_bos, "parse_special": special}
+        with self._post("/tokenize", body) as response:
+            return json.loads(response.read().decode("utf-8"))["tokens"]
+
+    def is_ready(self):
+        """服务是否已加载好模型"""
+        try:
+            with urllib.request.urlopen(f"{self.url}/health", timeout=2) as response:
+                return response.status == 200
+        except (urllib.error.URLError, OSError):
+            return False
+
+def build_command(server_config, runtime_config):
+    """根据配置生成 llama-server 命令行"""
+    kwargs = llama_kwargs(runtime_config)
+    parallel = server_config["parallel"]
+    cache_types = {v: k for k, v in KV_CACHE_TYPES.items()}
+    cmd = [
+        server_config["binary"],
+        "-m", server_config["model_path"],
+        "--host", server_config["host"],
+        "--port", str(server_config["port"]),
+        "-np", str(parallel),
+        "-cb",  # 连续批处理
+        "-c", str(kwargs["n_ctx"] * parallel),  # 总上下文在各槽位间平分
+        "-ngl", str(kwargs["n_gpu_layers"] if kwargs["n_gpu_layers"] >= 0 else 999),
+        "-t", str(kwargs["n_threads"]),
+        "-tb", str(kwargs["n_threads_batch"]),
+        "-b", str(kwargs["n_batch"]),
+        "-ctk", cache_types[kwargs["type_k"]],
+        "-ctv", cache_types[kwargs["type_v"]],
+    ]
+    if not kwargs["use_mmap"]:
+        cmd.append("--no-mmap")
+    if kwargs["use_mlock"]:
+        cmd.append("--mlock")
+    if kwargs["flash_attn"]:
+        cmd.append("-fa")
+    if server_config["draft_model_path"]:
+        cmd.extend(["-md", server_config["draft_model_path"]])
+    return cmd
+
+def main():
+    parser = argparse.ArgumentParser(description="本地聊天推理服务")
+    parser.add_argument("--config", default=DEFAULT_CONFIG_FILE)
+    parser.add_argument("--parallel", type=int)
+    parser.add_argument("--port", type=int)
+    args = parser.parse_args()
+
+    server_config = load_server_config(args.config)
+    if args.parallel:
+        server_config["parallel"] = args.parallel
+    if args.port:
+        server_config["port"] = args.port
+
+    cmd = build_command(server_config, load_runtime_config(args.config))
+    print(f"执行命令: {' '.join(cmd)}")
+    process = subprocess.Popen(cmd)
+
+    # 等待模型加载完成
+    client = ChatServerClient(server_url(server_config))
+    while process.poll() is None and not client.is_ready():
+        time.sleep(0.5)
+    if process.poll() is not None:
+        print(f"llama-server 启动失败，退出码 {process.returncode}")
+        return process.returncode
+    print(f"聊天服务已就绪: {client.url} ({server_config['parallel']} 个槽位)")
+
+    try:
+        return process.wait()
+    except KeyboardInterrupt:
+        process.send_signal(signal.SIGINT)
+        return process.wait()
+
+if __name__ == "__main__":
+    sys.exit(main())
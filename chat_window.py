@@ -1,12 +1,13 @@
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QTextEdit, QLineEdit, QPushButton, 
-                           QHBoxLayout, QLabel, QComboBox, QScrollArea, QFrame, QSizePolicy)
+                           QHBoxLayout, QLabel, QComboBox, QScrollArea, QFrame, QSizePolicy,
+                           QDialog, QListWidget)
 from PyQt6.QtCore import Qt, QTimer
 from PyQt6.QtGui import QIcon, QFont, QPalette, QColor, QTextCursor, QBrush, QImage, QPixmap
-from llama_chat_manager import LlamaChatManager
 from voice_chat_manager import VoiceChatManager
+from conversation_store import ConversationStore
+from tracing import tracer
 import os
-from pydub import AudioSegment
-from pydub.playback import play
+import time
 
 class MessageBubble(QFrame):
     def __init__(self, text, is_user=True, parent=None):
@@ -89,9 +90,20 @@ class CustomChatHistory(QTextEdit):
         """)
 
 class ChatWindow(QWidget):
-    def __init__(self):
+    def __init__(self, pet=None, chat_manager=None, store=None):
         super().__init__()
-        self.chat_manager = LlamaChatManager()
+        self.pet = pet  # 桌面宠物，用于根据回复播放动作
+        self.chat_manager = chat_manager  # 由宠物在后台加载后共享，为空时等待加载
+        self.pending_messages = []  # 模型就绪前收到的消息
+        self.model_error = None  # 宠物加载模型失败的原因
+        # 与聊天管理器共用同一个对话记录，只用于读取历史和搜索，写入由聊天管理器负责
+        if store is None and chat_manager is not None:
+            store = chat_manager.store
+        self.store = store or ConversationStore()
+        self.search_dialog = None
+        self.oldest_message_id = None  # 已显示的最早一条历史消息
+        self.history_exhausted = False
+        self.loading_history = False
         self.voice_manager = VoiceChatManager()
         self.is_recording = False
         self.current_music = None  # 当前播放的音乐
@@ -244,6 +256,17 @@ class ChatWindow(QWidget):
         
         layout.addWidget(mode_container)
         
+        # 聊天记录搜索
+        search_layout = QHBoxLayout()
+        self.search_field = QLineEdit()
+        self.search_field.setPlaceholderText("搜索聊天记录...")
+        self.search_field.returnPressed.connect(self.search_history)
+        search_button = QPushButton('搜索')
+        search_button.clicked.connect(self.search_history)
+        search_layout.addWidget(self.search_field)
+        search_layout.addWidget(search_button)
+        layout.addLayout(search_layout)
+        
         # 聊天记录显示区域
         self.messages_area = QWidget()
         self.messages_area.setStyleSheet("""
@@ -258,6 +281,7 @@ class ChatWindow(QWidget):
         self.messages_layout.setContentsMargins(10, 10, 10, 10)
         
         scroll = QScrollArea()
+        self.scroll_area = scroll
         scroll.setWidget(self.messages_area)
         scroll.setWidgetResizable(True)
         scroll.setStyleSheet("""
@@ -288,6 +312,9 @@ class ChatWindow(QWidget):
         """)
         layout.addWidget(scroll)
         
+        # 滚动到顶部时加载更早的历史记录
+        scroll.verticalScrollBar().valueChanged.connect(self.on_scroll)
+        
         # 输入区域容器
         input_container = QFrame()
         input_container.setObjectName("input_container")
@@ -322,9 +349,12 @@ class ChatWindow(QWidget):
         self.toggle_input_mode(0)
         
         self.setLayout(layout)
+        
+        # 只显示最近一页历史记录
+        self.load_history_page()
 
-    def add_message(self, text, is_user=True):
-        """添加新消息气泡"""
+    def add_message(self, text, is_user=True, prepend=False):
+        """添加新消息气泡，prepend 为 True 时插入到最上方"""
         bubble = MessageBubble(text, is_user)
         
         # 创建容器来控制气泡的对齐
@@ -343,6 +373,10 @@ class ChatWindow(QWidget):
             container_layout.addStretch(1)  # 添加弹性空间
             container_layout.setContentsMargins(10, 0, 60, 0)  # 调整左边距
         
+        if prepend:
+            self.messages_layout.insertWidget(0, container)
+            return
+        
         self.messages_layout.addWidget(container)
         
         # 滚动到底部
@@ -350,9 +384,76 @@ class ChatWindow(QWidget):
 
     def scroll_to_bottom(self):
         """滚动到最新消息"""
-        scrollbar = self.findChild(QScrollArea).verticalScrollBar()
+        scrollbar = self.scroll_area.verticalScrollBar()
         scrollbar.setValue(scrollbar.maximum())
 
+    def on_scroll(self, value):
+        """滚动到顶部时加载上一页历史记录"""
+        if value == 0 and not self.loading_history and not self.history_exhausted:
+            self.load_history_page()
+
+    def load_history_page(self, limit=30):
+        """从对话记录中加载一页更早的消息"""
+        try:
+            if self.oldest_message_id is None:
+                # 写线程约每0.5秒提交一次，先等排队的消息落盘，否则它们不会出现在任何一页里
+                self.store.flush()
+            messages = self.store.page(self.oldest_message_id, limit)
+        except Exception as e:
+            print(f"加载历史记录出错: {e}")
+            return
+        if len(messages) < limit:
+            self.history_exhausted = True
+        if not messages:
+            return
+        
+        self.loading_history = True
+        scrollbar = self.scroll_area.verticalScrollBar()
+        old_max = scrollbar.maximum()
+        is_first_page = self.oldest_message_id is None
+        self.oldest_message_id = messages[0]["id"]
+        
+        # 倒序插入到顶部，保持时间顺序
+        for message in reversed(messages):
+            self.add_message(message["content"], message["role"] == "user", prepend=True)
+        
+        def restore_position():
+            # 保持当前看到的内容不跳动；首页直接滚到底部
+            if is_first_page:
+                scrollbar.setValue(scrollbar.maximum())
+            else:
+                scrollbar.setValue(scrollbar.maximum() - old_max)
+            self.loading_history = False
+        QTimer.singleShot(0, restore_position)
+
+    def search_history(self):
+        """全文搜索聊天记录，结果在单独的窗口中按相关度列出"""
+        query = self.search_field.text().strip()
+        if not query:
+            return
+        try:
+            self.store.flush()
+            results = self.store.search(query, limit=50)
+        except Exception as e:
+            print(f"搜索聊天记录出错: {e}")
+            return
+        
+        if self.search_dialog:
+            self.search_dialog.close()
+        self.search_dialog = QDialog(self)
+        self.search_dialog.setWindowTitle(f"搜索: {query}")
+        self.search_dialog.resize(500, 400)
+        results_list = QListWidget()
+        results_list.setWordWrap(True)
+        for message in results:
+            when = time.strftime("%Y-%m-%d %H:%M", time.localtime(message["created_at"]))
+            speaker = "我" if message["role"] == "user" else "宠物"
+            results_list.addItem(f"[{when}] {speaker}: {message['content']}")
+        if not results:
+            results_list.addItem("没有找到相关的聊天记录")
+        QVBoxLayout(self.search_dialog).addWidget(results_list)
+        self.search_dialog.show()
+
     def change_chat_mode(self, index):
         """切换聊天模式"""
         self.toggle_input_mode(index)
@@ -387,19 +488,91 @@ class ChatWindow(QWidget):
             if message:
                 # 显示用户消息
                 self.add_message(message, True)
+                self.input_field.clear()
                 
                 # 获取模型回应
-                response = self.chat_manager.get_response(message)
-                if response:  # 确保有响应
-                    self.add_message(response, False)
-                else:
-                    self.add_message("抱歉，我现在无法回应。", False)
-                
-                self.input_field.clear()
+                self.respond(message)
         except Exception as e:
             print(f"发送消息时出错: {str(e)}")
             self.add_message("消息发送失败，请重试。", False)
     
+    def respond(self, text, speak=False, turn=None):
+        """获取模型回应并显示，模型未就绪时先排队"""
+        if turn is None:
+            turn = tracer.start_turn("voice" if speak else "chat")
+        
+        if not self.chat_manager:
+            if self.model_error:
+                self.reply_model_error(turn)
+                return
+            if self.pet:
+                # 模型还在后台加载，宠物先进入思考状态
+                if not self.pending_messages:
+                    self.add_message("*歪着脑袋想了想* 我还没睡醒呢，稍等一下哦～", False)
+                self.pending_messages.append((text, speak, turn))
+                self.pet.playThinking()
+                return
+            from llama_chat_manager import LlamaChatManager
+            self.chat_manager = LlamaChatManager(store=self.store)
+        
+        reply = self.chat_manager.process_input(text, turn)
+        if not reply.text:  # 确保有响应
+            self.add_message("抱歉，我现在无法回应。", False)
+            tracer.finish(turn)
+            return
+        self.add_message(reply.text, False)
+        self.play_reaction(reply.type)
+        
+        # 文字转语音并播放
+        if speak:
+            with turn.span("tts"):
+                speech_file = self.voice_manager.text_to_speech(reply.text)
+            if speech_file:
+                QTimer.singleShot(100, lambda: self.play_speech(speech_file, turn))
+                return
+        tracer.finish(turn)
+    
+    def play_speech(self, speech_file, turn):
+        """播放回复语音，并记录首次出声时间和播放时长"""
+        # 首次出声在解码完成、开始播放时才记录，解码耗时也算在内
+        with turn.span("playback"):
+            played = self.voice_manager.play_audio(speech_file, on_start=lambda: turn.mark("first_audio"))
+        # 交给系统播放器时它可能还没打开文件，留给定期清理删除
+        if played:
+            self.voice_manager.scratch.release(speech_file)
+        tracer.finish(turn)
+    
+    def set_chat_manager(self, chat_manager):
+        """模型加载完成后设置聊天管理器，并处理排队的消息"""
+        self.chat_manager = chat_manager
+        pending, self.pending_messages = self.pending_messages, []
+        for text, speak, turn in pending:
+            self.respond(text, speak, turn)
+    
+    def set_model_error(self, error):
+        """宠物加载模型失败（或开始重新加载时清除为None），排队的消息直接回复出错"""
+        self.model_error = error
+        if not error:
+            return
+        pending, self.pending_messages = self.pending_messages, []
+        if pending:
+            self.reply_model_error(pending[0][2])
+            for _, _, turn in pending[1:]:
+                turn.set("error", error)
+                tracer.finish(turn)
+    
+    def reply_model_error(self, turn):
+        """回复模型加载失败的提示并结束该轮记录"""
+        self.add_message("*耷拉着耳朵* 呜…我的脑袋没能醒过来，暂时没法聊天了。"
+                         "可以在托盘菜单里点「重新加载模型」再试试哦～", False)
+        turn.set("error", self.model_error)
+        tracer.finish(turn)
+    
+    def play_reaction(self, reaction_type):
+        """让桌面宠物根据回复的动作标签播放动画"""
+        if self.pet:
+            self.pet.playReaction(reaction_type)
+    
     def start_recording(self):
         """开始录音"""
         if self.voice_manager.start_recording():
@@ -415,28 +588,32 @@ class ChatWindow(QWidget):
             self.record_button.setText("按住说话")
             
             # 停止录音并获取录音文件
+            turn = tracer.start_turn("voice")
             audio_file = self.voice_manager.stop_recording()
+            turn.record("capture", self.voice_manager.last_capture_seconds * 1000)
             if audio_file and os.path.exists(audio_file):
                 # 语音转文字
-                text = self.voice_manager.speech_to_text(audio_file)
+                with turn.span("stt"):
+                    text = self.voice_manager.speech_to_text(audio_file)
+                turn.set("audio_saved_s", self.voice_manager.last_audio_saved_seconds)
+                self.voice_manager.scratch.release(audio_file)
                 if text:
                     # 显示用户消息
                     self.add_message(text, True)
                     
-                    # 获取模型回应
-                    response = self.chat_manager.get_response(text)
-                    self.add_message(response, False)
-                    
-                    # 文字转语音并播放
-                    speech_file = self.voice_manager.text_to_speech(response)
-                    if speech_file:
-                        QTimer.singleShot(100, lambda: self.voice_manager.play_audio(speech_file))
+                    # 获取模型回应并朗读
+                    self.respond(text, speak=True, turn=turn)
                     
                     self.voice_status.setText("准备就绪")
                 else:
+                    # 识别失败的轮次同样记录下来，便于排查
+                    turn.set("error", "未能识别语音")
+                    tracer.finish(turn)
                     self.voice_status.setText("未能识别语音")
                     QTimer.singleShot(2000, lambda: self.voice_status.setText("准备就绪"))
             else:
+                turn.set("error", "录音失败")
+                tracer.finish(turn)
                 self.voice_status.setText("录音失败")
                 QTimer.singleShot(2000, lambda: self.voice_status.setText("准备就绪"))
     
@@ -510,6 +687,8 @@ class ChatWindow(QWidget):
             if not self.current_music:
                 music_file = os.path.join("music", self.music_selector.currentText())
                 if os.path.exists(music_file):
+                    from pydub import AudioSegment
+                    from pydub.playback import play
                     self.current_music = AudioSegment.from_mp3(music_file)
                     play(self.current_music)
                     self.is_playing = True
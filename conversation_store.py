@@ -0,0 +1,196 @@
+import os
+import time
+import uuid
+import queue
+import atexit
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    action TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_messages_session ON messages(session, id);
+"""
+
+# 外部内容的FTS5索引，由触发器与 messages 表保持同步
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    content, content='messages', content_rowid='id', tokenize='{tokenizer}'
+);
+CREATE TRIGGER IF NOT EXISTS messages_ai AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_ad AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+END;
+"""
+
+class ConversationStore:
+    """基于SQLite(WAL)的对话记录，写入在后台线程批量提交，支持全文搜索和分页"""
+
+    def __init__(self, db_path="data/conversations.db", batch_size=64, flush_interval=0.5):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.session = uuid.uuid4().hex[:12]  # 每次启动为一个会话
+
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._local = threading.local()
+        self._queue = queue.Queue()
+        self._writer = None
+        self._writer_lock = threading.Lock()
+        self.fts_tokenizer = self._init_schema()
+        atexit.register(self.close)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")  # WAL 下足够安全，且不必每次提交都 fsync
+        return conn
+
+    @property
+    def conn(self):
+        """每个线程使用自己的读连接"""
+        if not hasattr(self._local, "conn"):
+            self._local.conn = self._connect()
+        return self._local.conn
+
+    def _init_schema(self):
+        conn = self.conn
+        conn.executescript(SCHEMA)
+        # 中文没有空格分词，优先用 trigram 分词器；旧版 SQLite 退回 unicode61，没有FTS5则用LIKE
+        for tokenizer in ("trigram", "unicode61"):
+            try:
+                conn.executescript(FTS_SCHEMA.format(tokenizer=tokenizer))
+                conn.commit()
+                return tokenizer
+            except sqlite3.OperationalError:
+                continue
+        print("SQLite 不支持FTS5，搜索将使用LIKE")
+        return None
+
+    def add(self, role, content, action=None):
+        """异步写入一条消息"""
+        self._ensure_writer()
+        self._queue.put((self.session, role, content, action, time.time()))
+
+    def add_turn(self, user_input, assistant_response, action=None):
+        """写入一轮对话"""
+        self.add("user", user_input)
+        self.add("assistant", assistant_response, action)
+
+    def _ensure_writer(self):
+        with self._writer_lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._write_loop, daemon=True)
+                self._writer.start()
+
+    def _write_loop(self):
+        """后台写线程：攒够一批或等待超时后在一个事务里提交"""
+        conn = self._connect()
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                break
+            batch = [item]
+            deadline = time.time() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0, deadline - time.time()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            try:
+                with conn:
+                    conn.executemany(
+                        "INSERT INTO messages(session, role, content, action, created_at) VALUES (?, ?, ?, ?, ?)",
+                        batch)
+            except Exception as e:
+                print(f"写入对话记录出错: {e}")
+            for _ in range(len(batch) + (1 if stop else 0)):
+                self._queue.task_done()
+            if stop:
+                break
+        conn.close()
+
+    def flush(self):
+        """等待所有排队的消息写入"""
+        self._queue.join()
+
+    def close(self):
+        """写完剩余消息并停止写线程"""
+        if self._writer is not None and self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join(timeout=5)
+
+    @staticmethod
+    def _to_dicts(rows):
+        return [dict(row) for row in rows]
+
+    def recent(self, limit=20):
+        """最近的若干条消息（按时间正序），用于恢复对话上下文"""
+        rows = self.conn.execute(
+            "SELECT * FROM messages ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        return self._to_dicts(reversed(rows))
+
+    def page(self, before_id=None, limit=30):
+        """向前翻页：返回 id 小于 before_id 的最近 limit 条消息（按时间正序）"""
+        if before_id is None:
+            return self.recent(limit)
+        rows = self.conn.execute(
+            "SELECT * FROM messages WHERE id < ? ORDER BY id DESC LIMIT ?", (before_id, limit)).fetchall()
+        return self._to_dicts(reversed(rows))
+
+    def get(self, ids):
+        """按 id 批量读取消息，保持传入顺序"""
+        if not ids:
+            return []
+        ids = [int(i) for i in ids]
+        placeholders = ",".join("?" * len(ids))
+        rows = self.conn.execute(f"SELECT * FROM messages WHERE id IN ({placeholders})", ids).fetchall()
+        by_id = {row["id"]: dict(row) for row in rows}
+        return [by_id[i] for i in ids if i in by_id]
+
+    def iter_after(self, after_id=0, batch=1000):
+        """按 id 顺序分批遍历 after_id 之后的消息，内存占用与总量无关"""
+        while True:
+            rows = self.conn.execute(
+                "SELECT * FROM messages WHERE id > ? ORDER BY id LIMIT ?", (after_id, batch)).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield dict(row)
+            after_id = rows[-1]["id"]
+
+    def search(self, query, limit=20):
+        """全文搜索历史消息，按相关度排序"""
+        query = query.strip()
+        if not query:
+            return []
+        # trigram 至少需要3个字符，更短的查询用LIKE
+        if self.fts_tokenizer and (self.fts_tokenizer != "trigram" or len(query) >= 3):
+            phrase = '"' + query.replace('"', '""') + '"'
+            rows = self.conn.execute(
+                "SELECT m.* FROM messages_fts f JOIN messages m ON m.id = f.rowid "
+                "WHERE messages_fts MATCH ? ORDER BY f.rank LIMIT ?", (phrase, limit)).fetchall()
+        else:
+            pattern = "%" + query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            rows = self.conn.execute(
+                "SELECT * FROM messages WHERE content LIKE ? ESCAPE '\\' ORDER BY id DESC LIMIT ?",
+                (pattern, limit)).fetchall()
+        return self._to_dicts(rows)
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
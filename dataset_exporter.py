@@ -0,0 +1,195 @@
+"""把对话记录增量导出为 sharegpt 格式的 JSONL 分片，用于微调宠物模型
+
+每次运行只处理上次导出位置（水位线）之后的消息；内容哈希保存在SQLite中去重，
+内存占用与对话总量无关。导出后在 dataset_info.json 中注册（或更新）对应的数据集。
+
+用法: python dataset_exporter.py [--db data/conversations.db] [--output data/datasets/pet_chat] [--rebuild]
+"""
+import os
+import sys
+import json
+import sqlite3
+import hashlib
+import argparse
+from conversation_store import ConversationStore
+
+STATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS hashes (
+    hash BLOB PRIMARY KEY
+) WITHOUT ROWID;
+"""
+
+class DatasetExporter:
+    """对话记录 -> sharegpt JSONL 分片的增量导出器"""
+
+    def __init__(self, store=None, output_dir="data/datasets/pet_chat", dataset_info="dataset_info.json",
+                 dataset_name="pet_chat", shard_size=10000, commit_every=1000):
+        self.store = store or ConversationStore()
+        self.output_dir = output_dir
+        self.dataset_info = dataset_info
+        self.dataset_name = dataset_name
+        self.shard_size = shard_size
+        self.commit_every = commit_every
+
+        os.makedirs(output_dir, exist_ok=True)
+        # 导出状态和内容哈希放在输出目录旁边：目录中只能有分片，训练时会加载目录下的所有文件
+        self.state = sqlite3.connect(os.path.normpath(output_dir) + ".state.db")
+        self.state.executescript(STATE_SCHEMA)
+
+    def _get(self, key, default=0):
+        row = self.state.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set(self, key, value):
+        self.state.execute("INSERT OR REPLACE INTO state(key, value) VALUES (?, ?)", (key, value))
+
+    def shard_path(self, index):
+        return os.path.join(self.output_dir, f"{self.dataset_name}-{index:05d}.jsonl")
+
+    def turns(self, after_id):
+        """按顺序产出同一会话中相邻的 (用户消息, 宠物回复)"""
+        user = None
+        for message in self.store.iter_after(after_id):
+            if message["role"] == "user":
+                user = message
+            elif message["role"] == "assistant" and user and user["session"] == message["session"]:
+                yield user, message
+                user = None
+
+    @staticmethod
+    def to_sample(user, assistant):
+        """回复保持模型输出的JSON格式，微调后仍能配合语法约束"""
+        reply = json.dumps({"text": assistant["content"], "action": assistant["action"] or "none"},
+                           ensure_ascii=False)
+        return {"conversations": [
+            {"from": "human", "value": user["content"]},
+            {"from": "gpt", "value": reply},
+        ]}
+
+    def _is_new(self, sample):
+        """内容哈希未出现过时记录下来并返回True"""
+        digest = hashlib.sha1(json.dumps(sample, ensure_ascii=False, sort_keys=True).encode("utf-8")).digest()
+        return self.state.execute("INSERT OR IGNORE INTO hashes(hash) VALUES (?)", (digest,)).rowcount == 1
+
+    def _open_shard(self, index, size):
+        """打开分片用于追加；上次中断时写了但未提交的部分先截掉"""
+        f = open(self.shard_path(index), 'ab')
+        if f.tell() > size:
+            f.truncate(size)
+            f.seek(size)
+        return f
+
+    def export(self):
+        """导出水位线之后的新对话，返回统计信息"""
+        watermark = self._get("watermark")
+        shard = self._get("shard")
+        shard_lines = self._get("shard_lines")
+        shard_bytes = self._get("shard_bytes")
+        exported = duplicates = pending = 0
+
+        f = self._open_shard(shard, shard_bytes)
+        try:
+            for user, assistant in self.turns(watermark):
+                sample = self.to_sample(user, assistant)
+                watermark = assistant["id"]
+                if not self._is_new(sample):
+                    duplicates += 1
+                    continue
+
+                if shard_lines >= self.shard_size:
+                    f.close()
+                    shard, shard_lines, shard_bytes = shard + 1, 0, 0
+                    f = self._open_shard(shard, 0)
+                line = (json.dumps(sample, ensure_ascii=False) + "\n").encode("utf-8")
+                f.write(line)
+                shard_lines += 1
+                shard_bytes += len(line)
+                exported += 1
+
+                pending += 1
+                if pending >= self.commit_every:
+                    self._commit(f, watermark, shard, shard_lines, shard_bytes)
+                    pending = 0
+            self._commit(f, watermark, shard, shard_lines, shard_bytes)
+        finally:
+            f.close()
+
+        self.register()
+        return {"exported": exported, "duplicates": duplicates, "watermark": watermark,
+                "shards": shard + 1}
+
+    def _commit(self, f, watermark, shard, shard_lines, shard_bytes):
+        """先把分片落盘，再在同一事务里提交水位线、分片位置和哈希"""
+        f.flush()
+        os.fsync(f.fileno())
+        self._set("watermark", watermark)
+        self._set("shard", shard)
+        self._set("shard_lines", shard_lines)
+        self._set("shard_bytes", shard_bytes)
+        self.state.commit()
+
+    def register(self):
+        """在 dataset_info.json 中注册数据集，内容不变时不重写文件"""
+        try:
+            with open(self.dataset_info, 'r', encoding='utf-8') as f:
+                info = json.load(f)
+        except FileNotFoundError:
+            info = {}
+
+        # file_name 相对于 dataset_info.json 所在目录；目录会加载其中所有分片
+        file_name = os.path.relpath(self.output_dir, os.path.dirname(os.path.abspath(self.dataset_info)))
+        entry = {
+            "file_name": file_name.replace(os.sep, "/"),
+            "formatting": "sharegpt",
+            "columns": {
+                "messages": "conversations"
+            }
+        }
+        if info.get(self.dataset_name) == entry:
+            return False
+
+        info[self.dataset_name] = entry
+        tmp_path = self.dataset_info + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(info, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        os.replace(tmp_path, self.dataset_info)
+        return True
+
+    def rebuild(self):
+        """清空已导出的分片和状态，下次从头导出"""
+        self.state.executescript("DELETE FROM state; DELETE FROM hashes;")
+        self.state.commit()
+        for name in os.listdir(self.output_dir):
+            if name.startswith(f"{self.dataset_name}-") and name.endswith(".jsonl"):
+                os.remove(os.path.join(self.output_dir, name))
+
+    def close(self):
+        self.state.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="导出对话记录为微调数据集")
+    parser.add_argument("--db", default="data/conversations.db")
+    parser.add_argument("--output", default="data/datasets/pet_chat")
+    parser.add_argument("--dataset-info", default="dataset_info.json")
+    parser.add_argument("--name", default="pet_chat")
+    parser.add_argument("--shard-size", type=int, default=10000)
+    parser.add_argument("--rebuild", action="store_true", help="清空后从头导出")
+    args = parser.parse_args()
+
+    exporter = DatasetExporter(ConversationStore(args.db), args.output, args.dataset_info,
+                               args.name, args.shard_size)
+    if args.rebuild:
+        exporter.rebuild()
+    stats = exporter.export()
+    exporter.close()
+    print(f"新导出 {stats['exported']} 条，跳过重复 {stats['duplicates']} 条，"
+          f"水位线 {stats['watermark']}，共 {stats['shards']} 个分片")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
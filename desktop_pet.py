@@ -1,59 +1,90 @@
 import sys
-from PyQt6.QtWidgets import QApplication, QWidget, QSystemTrayIcon, QMenu, QStyle, QLabel
-from PyQt6.QtGui import QIcon, QPixmap, QPalette, QBrush, QImage
-from PyQt6.QtCore import Qt, QPoint, QTimer, QPropertyAnimation, QEasingCurve, QRect
-import os
+from PyQt6.QtWidgets import QApplication, QWidget, QSystemTrayIcon, QMenu, QStyle
+from PyQt6.QtGui import QIcon, QPalette, QBrush, QPainter, QColor
+from PyQt6.QtCore import Qt, QPoint, QPointF, QTimer, QPropertyAnimation, QEasingCurve, QRect
 import random
-from chat_window import ChatWindow
 import time
-from llama_chat_manager import LlamaChatManager
+import argparse
+from model_loader import ModelLoader
+from frame_profiler import FrameProfiler
+from process_stats import rss_bytes
+from sprite_repository import SKINS, DEFAULT_SKIN, PET_SIZE, sprites
+from animation_clock import clock
+
+# 不同动画使用不同的帧间隔(ms)
+FRAME_DELAYS = {
+    'idle': 100,
+    'idle_blink': 100,
+    'walk': 80,
+    'walk_happy': 80,
+    'run': 60,
+    'jump_up': 100,
+    'jump_fall': 100,
+    'jump_throw': 80,
+    'hurt': 100,
+    'hurt_dizzy': 120,
+    'throw': 80,
+    'dead': 150
+}
+
+HUD_REFRESH_INTERVAL = 500  # 监视浮层刷新间隔(ms)
+HUD_LOG_INTERVAL = 5  # 帧率日志写入间隔(秒)
 
 class DesktopPet(QWidget):
-    def __init__(self):
+    """桌面宠物
+
+    动画帧来自共享的 sprites，定时由共享的 clock 驱动，每只宠物只保存自己的播放状态。
+    owner 为另一只宠物时，本宠物是它的同伴：不创建托盘图标、不加载模型，聊天交给 owner。
+    """
+    def __init__(self, profile=False, skin=DEFAULT_SKIN, owner=None, load_model=True):
         super().__init__()
+        self.skin = skin
+        self.owner = owner
+        self.current_sequence = None
+        self.thinking = False  # 模型未就绪时的思考状态
+        self.profiling = False  # 是否显示帧率/内存监视浮层
+        self.frame_profiler = FrameProfiler()
+        self.hud_text = ""
+        self.hud_log_time = 0
+        self.screen_tracking = False  # 是否已监听窗口所在屏幕的变化
         self.loadAnimations()
         self.initUI()
         self.dragging = False
         self.offset = QPoint()
         self.setupAnimations()
-        self.current_sequence = None
         self.click_count = 0  # 记录点击次数
         self.last_click_time = 0  # 记录上次点击时间
-        self.chat_manager = LlamaChatManager()
+        
+        # 模型在后台加载，先让宠物显示出来
+        self.chat_manager = None
+        self.pending_inputs = []  # 模型就绪前收到的输入
+        self.model_loader = None
+        self.model_error = None  # 模型加载失败的原因，重新加载前不再排队等待
+        self.store = None  # 聊天管理器与聊天窗口共用的对话记录
+        if owner is None and load_model:
+            from conversation_store import ConversationStore
+            self.store = ConversationStore()
+            self.model_loader = ModelLoader(self, store=self.store)
+            self.model_loader.loaded.connect(self.onModelLoaded)
+            self.model_loader.failed.connect(self.onModelFailed)
+            QApplication.instance().aboutToQuit.connect(self.waitModelLoader)
+            QTimer.singleShot(0, self.model_loader.start)
+        
+        if profile:
+            self.setProfiling(True)
         
     def loadAnimations(self):
-        """加载所有动画帧"""
-        self.animations = {
-            'idle': self.loadAnimationFrames('01-Idle/01-Idle'),
-            'idle_blink': self.loadAnimationFrames('01-Idle/02-Idle_Blink'),
-            'walk': self.loadAnimationFrames('03-Walk/01-Walk'),
-            'walk_happy': self.loadAnimationFrames('03-Walk/02-Walk_Happy'),
-            'run': self.loadAnimationFrames('04-Run'),
-            'jump_up': self.loadAnimationFrames('06-Jump/01-Jump_Up'),
-            'jump_fall': self.loadAnimationFrames('06-Jump/02-Jump_Fall'),
-            'jump_throw': self.loadAnimationFrames('06-Jump/03-Jump_Throw'),
-            'hurt': self.loadAnimationFrames('07-Hurt/01-Hurt'),
-            'hurt_dizzy': self.loadAnimationFrames('07-Hurt/02-Hurt_Dizzy'),
-            'throw': self.loadAnimationFrames('02-Throw'),
-            'dead': self.loadAnimationFrames('08-Dead')
-        }
+        """加载默认动画帧，其余动画在窗口显示后再加载"""
+        # 每种设备像素比一套帧，移到不同缩放比例的屏幕时切换
+        self.device_pixel_ratio = QApplication.primaryScreen().devicePixelRatio()
+        self.animations = sprites.load(self.skin, self.device_pixel_ratio, ['idle'])
         self.current_animation = 'idle'
         self.current_frame = 0
-        
-    def loadAnimationFrames(self, folder):
-        """加载指定文件夹中的所有动画帧"""
-        frames = []
-        base_path = f'assets/Animation PNG/PANDA/NUDE/{folder}'
-        try:
-            files = sorted(os.listdir(base_path))
-            for file in files:
-                if file.endswith('.png'):
-                    pixmap = QPixmap(os.path.join(base_path, file))
-                    frames.append(pixmap.scaled(100, 100, Qt.AspectRatioMode.KeepAspectRatio,
-                                             Qt.TransformationMode.SmoothTransformation))
-        except Exception as e:
-            print(f"加载动画帧错误 {folder}: {e}")
-        return frames
+        QTimer.singleShot(0, self.loadRemainingAnimations)
+    
+    def loadRemainingAnimations(self):
+        """加载剩余的动画帧（已被其他宠物加载的直接共用）"""
+        sprites.load(self.skin, self.device_pixel_ratio)
 
     def playSequence(self, sequence):
         """播放动作序列"""
@@ -78,7 +109,7 @@ class DesktopPet(QWidget):
 
     def randomAction(self):
         """随机执行一个动作或动作序列"""
-        if self.dragging or self.current_sequence:
+        if self.dragging or self.current_sequence or self.thinking:
             return
             
         # 定义动作序列
@@ -119,28 +150,9 @@ class DesktopPet(QWidget):
             self.current_animation = animation_name
             self.current_frame = 0
             
-            if hasattr(self, 'anim_timer'):
-                self.anim_timer.stop()
-            
-            self.anim_timer = QTimer(self)
-            self.anim_timer.timeout.connect(self.nextFrame)
-            
-            # 不同动画使用不同的帧率
-            frame_delays = {
-                'idle': 100,
-                'idle_blink': 100,
-                'walk': 80,
-                'walk_happy': 80,
-                'run': 60,
-                'jump_up': 100,
-                'jump_fall': 100,
-                'jump_throw': 80,
-                'hurt': 100,
-                'hurt_dizzy': 120,
-                'throw': 80,
-                'dead': 150
-            }
-            self.anim_timer.start(frame_delays.get(animation_name, 100))
+            delay = FRAME_DELAYS.get(animation_name, 100)
+            self.frame_profiler.reset(delay)
+            clock.subscribe(self.nextFrame, delay)
 
     def nextFrame(self):
         """显示动画的下一帧"""
@@ -148,7 +160,53 @@ class DesktopPet(QWidget):
             frames = self.animations[self.current_animation]
             if frames:
                 self.current_frame = (self.current_frame + 1) % len(frames)
-                self.pet_label.setPixmap(frames[self.current_frame])
+                self.update()
+                if self.profiling:
+                    self.frame_profiler.tick()
+
+    def paintEvent(self, event):
+        """直接绘制当前帧，开启监视时在上面叠加统计信息"""
+        painter = QPainter(self)
+        frames = self.animations.get(self.current_animation)
+        if frames:
+            pixmap = frames[self.current_frame % len(frames)]
+            size = pixmap.deviceIndependentSize()
+            painter.drawPixmap(QPointF((self.width() - size.width()) / 2,
+                                       (self.height() - size.height()) / 2), pixmap)
+        
+        if self.profiling:
+            painter.fillRect(self.rect(), QColor(0, 0, 0, 150))
+            font = painter.font()
+            font.setPixelSize(9)
+            painter.setFont(font)
+            painter.setPen(Qt.GlobalColor.white)
+            painter.drawText(self.rect().adjusted(2, 2, -2, -2),
+                             Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignTop, self.hud_text)
+        painter.end()
+
+    def showEvent(self, event):
+        """窗口创建后开始监听所在屏幕的变化"""
+        super().showEvent(event)
+        handle = self.windowHandle()
+        if handle and not self.screen_tracking:
+            handle.screenChanged.connect(self.onScreenChanged)
+            self.screen_tracking = True
+            self.onScreenChanged(handle.screen())
+
+    def onScreenChanged(self, screen):
+        """移到另一块屏幕时，改用与其缩放比例匹配的帧集"""
+        if screen is None:
+            return
+        self.screen_rect = screen.geometry()
+        dpr = screen.devicePixelRatio()
+        if dpr == self.device_pixel_ratio:
+            return
+        
+        self.device_pixel_ratio = dpr
+        # 当前动画立即加载，其余的稍后加载
+        self.animations = sprites.load(self.skin, dpr, [self.current_animation])
+        QTimer.singleShot(0, self.loadRemainingAnimations)
+        self.update()
 
     def initUI(self):
         # 设置窗口属性
@@ -157,15 +215,8 @@ class DesktopPet(QWidget):
         self.setWindowFlag(Qt.WindowType.WindowStaysOnTopHint)
         self.setAttribute(Qt.WidgetAttribute.WA_TranslucentBackground)
         
-        # 创建标签来显示图片
-        self.pet_label = QLabel(self)
-        self.setFixedSize(100, 100)  # 设置固定大小
-        self.pet_label.setFixedSize(100, 100)  # 设置标签大小
-        self.pet_label.setAlignment(Qt.AlignmentFlag.AlignCenter)  # 居中对齐
-        
-        # 如果有动画帧，显示第一帧
-        if self.animations['idle']:
-            self.pet_label.setPixmap(self.animations['idle'][0])
+        # 动画帧在 paintEvent 中直接绘制
+        self.setFixedSize(PET_SIZE, PET_SIZE)  # 设置固定大小
         
         # 移动到屏幕右边
         screen = QApplication.primaryScreen().geometry()
@@ -173,6 +224,22 @@ class DesktopPet(QWidget):
         self.move(screen.width() - self.width() - 50,
                  screen.height() // 2 - self.height() // 2)
         
+        self.chat_window = None
+        self.trace_panel = None
+        self.hud_action = None
+        # 同伴宠物共用 owner 的托盘图标
+        if self.owner is None:
+            self.initTray()
+        
+        # 开始播放默认动画
+        self.playAnimation('idle')
+        
+        # 在 initUI 方法中：
+        palette = self.palette()
+        palette.setBrush(QPalette.ColorRole.Window, QBrush(sprites.pixmap("background/panda_back.jpg")))
+        self.setPalette(palette)
+    
+    def initTray(self):
         # 创建系统托盘图标
         self.tray_icon = QSystemTrayIcon(self)
         # 使用第一帧动画作为图标
@@ -184,36 +251,33 @@ class DesktopPet(QWidget):
         # 创建托盘菜单
         tray_menu = QMenu()
         chat_action = tray_menu.addAction('开始聊天')
+        trace_action = tray_menu.addAction('性能面板')
+        self.hud_action = tray_menu.addAction('帧率监视')
+        self.hud_action.setCheckable(True)
+        self.reload_action = tray_menu.addAction('重新加载模型')
+        self.reload_action.setVisible(False)  # 只在模型加载失败后显示
         quit_action = tray_menu.addAction('退出')
         
         # 绑定事件
         chat_action.triggered.connect(self.open_chat)
+        trace_action.triggered.connect(self.open_trace_panel)
+        self.hud_action.toggled.connect(self.setProfiling)
+        self.reload_action.triggered.connect(self.reloadModel)
         quit_action.triggered.connect(QApplication.instance().quit)
         
         self.tray_icon.setContextMenu(tray_menu)
         self.tray_icon.show()
-        
-        self.chat_window = None
-        
-        # 开始播放默认动画
-        self.playAnimation('idle')
-        
-        # 在 initUI 方法中：
-        background = QImage("background/panda_back.jpg")
-        palette = self.palette()
-        palette.setBrush(QPalette.ColorRole.Window, QBrush(QPixmap.fromImage(background)))
-        self.setPalette(palette)
     
     def setupAnimations(self):
-        # 设置随机动作定时器
-        self.action_timer = QTimer(self)
-        self.action_timer.timeout.connect(self.randomAction)
-        self.action_timer.start(3000)
-        
-        # 设置位置检查定时器
-        self.position_timer = QTimer(self)
-        self.position_timer.timeout.connect(self.checkScreenPosition)
-        self.position_timer.start(1000)  # 每秒检查一次位置
+        # 随机动作和位置检查都挂在共享时钟上，不为每只宠物创建定时器
+        clock.subscribe(self.randomAction, 3000)
+        clock.subscribe(self.checkScreenPosition, 1000)  # 每秒检查一次位置
+
+    def closeEvent(self, event):
+        """关闭时从共享时钟上移除"""
+        for callback in (self.nextFrame, self.randomAction, self.checkScreenPosition):
+            clock.unsubscribe(callback)
+        super().closeEvent(event)
 
     def checkScreenPosition(self):
         """检查并响应屏幕位置"""
@@ -222,7 +286,7 @@ class DesktopPet(QWidget):
         margin = 50  # 边缘检测范围
         
         # 如果当前没有播放序列，才检查位置
-        if not self.current_sequence:
+        if not self.current_sequence and not self.thinking:
             # 靠近左边缘
             if pos.x() < margin:
                 self.playSequence([('walk_happy', 800), ('jump_up', 400), ('jump_fall', 400)])
@@ -286,24 +350,154 @@ class DesktopPet(QWidget):
                 self.checkScreenPosition()
 
     def open_chat(self):
+        if self.owner:
+            return self.owner.open_chat()
         if not self.chat_window:
-            self.chat_window = ChatWindow()
+            # 延迟导入聊天窗口，避免启动时加载语音相关依赖
+            from chat_window import ChatWindow
+            self.chat_window = ChatWindow(pet=self, chat_manager=self.chat_manager, store=self.store)
+            if self.model_error:
+                self.chat_window.set_model_error(self.model_error)
         self.chat_window.show()
 
+    def open_trace_panel(self):
+        """打开性能调试面板"""
+        if not self.trace_panel:
+            from trace_panel import TracePanel
+            self.trace_panel = TracePanel()
+        self.trace_panel.show()
+
+    def setProfiling(self, enabled):
+        """开关帧率/内存监视浮层，开启期间定期写入帧率日志"""
+        self.profiling = enabled
+        if self.hud_action:
+            self.hud_action.setChecked(enabled)
+        if not hasattr(self, 'hud_timer'):
+            self.hud_timer = QTimer(self)
+            self.hud_timer.timeout.connect(self.updateHud)
+        
+        if enabled:
+            self.frame_profiler.reset(self.frame_profiler.target_ms)
+            self.hud_timer.start(HUD_REFRESH_INTERVAL)
+            self.updateHud()
+        else:
+            self.hud_timer.stop()
+            self.update()
+
+    def updateHud(self):
+        """刷新监视浮层，并按间隔写入日志"""
+        stats = self.frame_profiler.stats()
+        pixmap_bytes = sprites.memory_bytes()
+        rss = rss_bytes()
+        self.hud_text = (
+            f"帧 {stats['actual_ms']:.0f}/{stats['target_ms']}ms\n"
+            f"抖动 {stats['jitter_ms']:.1f}ms\n"
+            f"丢帧 {stats['dropped']}\n"
+            f"帧缓存 {pixmap_bytes / 1024 / 1024:.1f}MB\n"
+            f"RSS {rss / 1024 / 1024:.0f}MB"
+        )
+        self.update()
+        
+        now = time.time()
+        if now - self.hud_log_time >= HUD_LOG_INTERVAL:
+            self.hud_log_time = now
+            self.frame_profiler.log(pixmap_bytes=pixmap_bytes, rss_bytes=rss,
+                                    animation=self.current_animation, thinking=self.thinking)
+
+    def onModelLoaded(self, manager):
+        """模型加载完成"""
+        self.chat_manager = manager
+        self.stopThinking()
+        if self.chat_window:
+            self.chat_window.set_chat_manager(manager)
+        
+        # 处理模型就绪前收到的输入
+        pending, self.pending_inputs = self.pending_inputs, []
+        for user_input in pending:
+            self.chat_response(user_input)
+
+    def onModelFailed(self, error):
+        """模型加载失败：记录原因，不再让输入排队等待"""
+        self.model_error = error
+        self.stopThinking()
+        if self.pending_inputs:
+            print(f"模型加载失败，丢弃 {len(self.pending_inputs)} 条等待中的输入")
+            self.pending_inputs = []
+        if self.chat_window:
+            self.chat_window.set_model_error(error)
+        self.reload_action.setVisible(True)
+        self.tray_icon.showMessage('桌面宠物', f'模型加载失败: {error}\n可在托盘菜单中重新加载模型')
+
+    def waitModelLoader(self):
+        """退出前等待加载线程结束：QThread 运行中被销毁会使进程异常退出"""
+        if self.model_loader and self.model_loader.isRunning():
+            # 加载在 llama.cpp 内部进行，无法中途打断，只能等它结束
+            print("等待模型加载结束后退出...")
+            self.model_loader.loaded.disconnect()
+            self.model_loader.failed.disconnect()
+            self.model_loader.wait()
+
+    def reloadModel(self):
+        """模型加载失败后重新加载"""
+        if not self.model_loader or self.model_loader.isRunning():
+            return
+        self.model_error = None
+        self.reload_action.setVisible(False)
+        if self.chat_window:
+            self.chat_window.set_model_error(None)
+        self.model_loader.start()
+
+    def playThinking(self):
+        """模型未就绪时播放思考动画"""
+        self.thinking = True
+        self.current_sequence = None
+        self.playAnimation('idle_blink' if 'idle_blink' in self.animations else 'idle')
+
+    def stopThinking(self):
+        """结束思考动画"""
+        if self.thinking:
+            self.thinking = False
+            self.playAnimation('idle')
+
     def chat_response(self, user_input):
         """处理用户输入并生成回应"""
-        response = self.chat_manager.process_input(user_input)
+        if self.owner:
+            return self.owner.chat_response(user_input)
+        if self.model_error:
+            return None
+        if not self.chat_manager:
+            self.pending_inputs.append(user_input)
+            self.playThinking()
+            return None
         
-        # 根据回应类型触发相应动作
-        if response.type == 'comfort':
+        response = self.chat_manager.process_input(user_input)
+        self.playReaction(response.type)
+        return response
+
+    def playReaction(self, reaction_type):
+        """根据回应类型触发相应动作"""
+        if reaction_type == 'comfort':
             self.playSequence([('walk_happy', 800), ('idle_blink', 500)])
-        elif response.type == 'encourage':
+        elif reaction_type == 'encourage':
             self.playSequence([('jump_up', 400), ('jump_fall', 400)])
-        elif response.type == 'cheer_up':
+        elif reaction_type == 'cheer_up':
             self.playSequence([('throw', 800), ('walk_happy', 800)])
 
 if __name__ == '__main__':
-    app = QApplication(sys.argv)
-    pet = DesktopPet()
+    parser = argparse.ArgumentParser(description="桌面宠物")
+    parser.add_argument("--profile", action="store_true", help="显示帧率/内存监视浮层")
+    parser.add_argument("--count", type=int, default=1, help="宠物数量")
+    parser.add_argument("--skin", nargs="+", choices=list(SKINS), default=[DEFAULT_SKIN],
+                        help="皮肤，多只宠物时轮流使用")
+    args, qt_args = parser.parse_known_args()
+    
+    app = QApplication(sys.argv[:1] + qt_args)
+    pet = DesktopPet(profile=args.profile, skin=args.skin[0])
     pet.show()
+    # 同伴宠物从主宠物的位置向左排开，排满一行后换行
+    columns = max(1, pet.x() // PET_SIZE)
+    for i in range(1, args.count):
+        companion = DesktopPet(skin=args.skin[i % len(args.skin)], owner=pet)
+        companion.move(pet.x() - i % columns * PET_SIZE, pet.y() + i // columns * PET_SIZE)
+        companion.show()
     sys.exit(app.exec()) 
\ No newline at end of file
@@ -0,0 +1,61 @@
+import os
+import json
+import time
+from collections import deque
+from tracing import percentile
+
+class FrameProfiler:
+    """统计动画定时器的实际帧间隔、抖动和丢帧，并可定期写入JSONL日志
+
+    日志中的 time 与 tracing 的记录使用同一时钟(time.time)，便于把卡顿和模型/语音识别的耗时对照起来。
+    """
+    def __init__(self, window=120, log_path=None):
+        self.intervals = deque(maxlen=window)  # 最近的帧间隔(ms)
+        self.target_ms = 0
+        self.last_tick = None
+        self.frames = 0
+        self.dropped = 0
+        self.log_path = log_path or os.path.join("logs", f"frames_{time.strftime('%Y%m%d%H%M%S')}.jsonl")
+
+    def reset(self, target_ms):
+        """切换动画时调用：新的目标间隔，且不把切换前后的间隔算进去"""
+        self.target_ms = target_ms
+        self.last_tick = None
+        self.intervals.clear()  # 旧动画的间隔按旧目标统计，不能混进新目标的 p95 和抖动
+
+    def tick(self):
+        """每显示一帧调用一次"""
+        now = time.perf_counter()
+        if self.last_tick is not None:
+            interval = (now - self.last_tick) * 1000
+            self.intervals.append(interval)
+            if self.target_ms:
+                # 间隔超过目标的1.5倍时，按落后的整帧数计为丢帧
+                self.dropped += max(0, int(interval / self.target_ms + 0.5) - 1)
+        self.last_tick = now
+        self.frames += 1
+
+    def stats(self):
+        """最近窗口内的帧间隔统计"""
+        intervals = list(self.intervals)
+        actual = sum(intervals) / len(intervals) if intervals else 0.0
+        jitter = sum(abs(i - self.target_ms) for i in intervals) / len(intervals) if intervals else 0.0
+        return {
+            "target_ms": self.target_ms,
+            "actual_ms": actual,
+            "p95_ms": percentile(intervals, 95),
+            "jitter_ms": jitter,
+            "frames": self.frames,
+            "dropped": self.dropped,
+        }
+
+    def log(self, **extra):
+        """追加一条统计记录，extra 为其他指标（如内存、当前动画）"""
+        record = {"time": time.time(), **self.stats(), **extra}
+        try:
+            os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except OSError as e:
+            print(f"写入帧率日志出错: {e}")
+        return record
@@ -1,25 +1,199 @@
-from llama_cpp import Llama
+import os
+import re
+import json
 import time
+from response_cache import ResponseCache
+from model_router import ModelRouter, ConfidenceMeter
+from llama_runtime import DEFAULT_CONFIG_FILE, load_runtime_config, llama_kwargs
+from chat_server import ChatServerClient, load_server_config, server_url
+from conversation_store import ConversationStore
+from memory_index import RetrievalMemory, LocalEmbedder
+from tracing import tracer
+
+# 回复的动作标签，由 DesktopPet 映射到动画序列
+REPLY_ACTIONS = ["comfort", "encourage", "cheer_up", "none"]
+
+# GBNF 语法：约束模型一次生成同时输出回复文本和动作标签
+REPLY_GRAMMAR = r'''
+root   ::= "{" ws "\"text\":" ws string "," ws "\"action\":" ws action ws "}"
+action ::= "\"comfort\"" | "\"encourage\"" | "\"cheer_up\"" | "\"none\""
+string ::= "\"" char* "\""
+char   ::= [^"\\\x00-\x1f] | "\\" (["\\/bfnrt] | "u" hex hex hex hex)
+hex    ::= [0-9a-fA-F]
+ws     ::= [ \t\n]*
+'''
+
+# 输出被 max_tokens 截断时，从残缺的JSON中取出已生成的字段
+TEXT_FIELD = re.compile(r'"text"\s*:\s*"((?:[^"\\]|\\.)*)')
+ACTION_FIELD = re.compile(r'"action"\s*:\s*"(\w+)"')
+
+# llama_config.json 中 chat 部分的默认值
+DEFAULT_CHAT = {
+    "fresh_answers": False,  # 为True时总是重新生成，不直接使用缓存的回复
+    "speculative": "none",   # 投机解码：none、prompt_lookup 或 draft（用小模型作草稿模型）
+    "num_draft_tokens": 8,   # 每步草稿token数
+}
+
+def load_chat_config(config_file=DEFAULT_CONFIG_FILE):
+    """读取聊天配置并与默认值合并"""
+    config = dict(DEFAULT_CHAT)
+    if os.path.exists(config_file):
+        try:
+            with open(config_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            config.update({k: v for k, v in data.get("chat", {}).items() if k in DEFAULT_CHAT})
+        except Exception as e:
+            print(f"读取聊天配置出错: {e}")
+    return config
+
+class ChatReply:
+    """带动作标签的回复"""
+    def __init__(self, text, type="none", complete=True):
+        self.text = text
+        self.type = type if type in REPLY_ACTIONS else "none"
+        # 模型输出不是完整的JSON时为False，这类回复不写入缓存
+        self.complete = complete
+    
+    def to_dict(self):
+        return {"text": self.text, "action": self.type}
+    
+    @classmethod
+    def from_dict(cls, data):
+        # 兼容旧版本缓存中的纯文本回复
+        if isinstance(data, str):
+            return cls(data)
+        return cls(data.get("text", ""), data.get("action", "none"))
 
 class LlamaChatManager:
-    def __init__(self):
-        """初始化Llama聊天管理器"""
+    def __init__(self, use_cache=True, fresh_answers=None,
+                 small_model_path="models/Llama3.2-1B-q4_k_m.gguf",
+                 speculative=None, num_draft_tokens=None, runtime_config=None, server=None,
+                 persist=True, memory=True, embedding_model_path="models/bge-small-zh-v1.5-q8_0.gguf",
+                 store=None):
+        """初始化Llama聊天管理器
+        
+        use_cache: 是否启用回复缓存
+        fresh_answers: 为True时总是重新生成（保留采样多样性），但仍会更新缓存；
+                       为None时读取 llama_config.json 的 chat.fresh_answers
+        small_model_path: 处理简短闲聊的小模型，文件不存在或使用推理服务时所有请求都交给大模型
+        speculative: 投机解码模式，'none'、'prompt_lookup' 或 'draft'（用小模型作草稿模型）
+        num_draft_tokens: 每步草稿token数
+                          （以上三项为None时读取 llama_config.json 的 chat 部分）
+        runtime_config: llama 运行参数，默认读取 llama_config.json
+        server: 本地推理服务地址；为None时按 llama_config.json 的 server 配置决定，
+                启用后大模型由 chat_server.py 持有，本类只作为客户端
+        persist: 是否把对话保存到 SQLite 对话记录
+        store: 与聊天窗口共用的 ConversationStore，为None时自行创建
+        memory: 是否启用基于嵌入检索的长期记忆（需要 persist）
+        embedding_model_path: 生成嵌入的专用小模型（使用推理服务时也在本进程加载，
+                              聊天服务的大模型不能同时提供嵌入）；文件不存在时不启用长期记忆
+        """
         # 使用正确的路径格式
         self.model_path = "models/Llama3-q4_k_m-v1.gguf"
         
-        # 加载GGUF模型
-        self.model = Llama(
-            model_path=self.model_path,
-            n_ctx=4096,  # 上下文窗口大小
-            n_gpu_layers=-1  # 使用所有可用的GPU层
-        )
+        chat_config = load_chat_config()
+        if fresh_answers is None:
+            fresh_answers = chat_config["fresh_answers"]
+        if speculative is None:
+            speculative = chat_config["speculative"]
+        if num_draft_tokens is None:
+            num_draft_tokens = chat_config["num_draft_tokens"]
+        
+        # 运行参数（线程数、批大小、KV缓存类型等）
+        self.runtime_config = runtime_config or load_runtime_config()
+        if server is None:
+            server_config = load_server_config()
+            server = server_url(server_config) if server_config["enabled"] else None
+        self.server = server
+        
+        # 常驻的小模型及路由器；使用推理服务时前端只作为客户端，不在本进程加载任何模型
+        self.small_model = None
+        self.router = None
+        if small_model_path and not self.server and os.path.exists(small_model_path):
+            from llama_cpp import Llama
+            # 上下文与大模型一致：小模型收到的是同样的完整提示，draft 模式下也要容纳整段上下文
+            self.small_model = Llama(
+                model_path=small_model_path,
+                verbose=False,
+                **llama_kwargs(self.runtime_config)
+            )
+            self.router = ModelRouter()
+            print(f"已加载小模型: {small_model_path}")
+        
+        # 投机解码的草稿模型（draft 模式与路由共用同一个小模型）
+        # 使用推理服务时由服务端的 -md 参数负责
+        self.draft_model = None
+        if speculative and speculative != "none" and not self.server:
+            if speculative == "draft" and not self.small_model:
+                print(f"draft 模式需要小模型 {small_model_path}，不启用投机解码")
+            else:
+                from speculative import create_draft_model
+                self.draft_model = create_draft_model(speculative, self.small_model, num_draft_tokens)
+        
+        # 加载GGUF模型，或连接共享模型的推理服务
+        if self.server:
+            self.model = ChatServerClient(self.server)
+            print(f"已连接聊天服务: {self.server}")
+        else:
+            from llama_cpp import Llama
+            self.model = Llama(
+                model_path=self.model_path,
+                draft_model=self.draft_model,
+                **llama_kwargs(self.runtime_config)
+            )
+        
+        # 大模型解码速度统计
+        self.decode_tokens = 0
+        self.decode_seconds = 0.0
+        self.last_tokens_per_sec = 0.0
+        
+        # 结构化输出语法（推理服务直接接收GBNF文本）
+        self.grammar = REPLY_GRAMMAR
+        if not self.server:
+            from llama_cpp import LlamaGrammar
+            self.grammar = LlamaGrammar.from_string(REPLY_GRAMMAR, verbose=False)
+        
+        # 对话记录，启动时只取最近10轮作为上下文
+        self.store = (store or ConversationStore()) if persist else None
         
         # 对话历史
         self.history = []
+        if self.store:
+            self.history = [{"role": m["role"], "content": m["content"]} for m in self.store.recent(20)]
         
+        # 长期记忆：只把与当前输入相关的几条旧消息放进提示，而不是加长历史
+        self.memory = None
+        if memory and self.store:
+            try:
+                if embedding_model_path and os.path.exists(embedding_model_path):
+                    embedder = LocalEmbedder(
+                        embedding_model_path,
+                        runtime_kwargs=llama_kwargs(self.runtime_config, n_ctx=512, n_batch=512)
+                    )
+                    self.memory = RetrievalMemory(self.store, embedder, embedder.name)
+                else:
+                    print(f"未找到嵌入模型 {embedding_model_path}，不启用长期记忆")
+                if self.memory:
+                    self.memory.schedule_sync()
+            except Exception as e:
+                print(f"加载长期记忆出错: {e}")
+        
+        # 回复缓存
+        self.cache = ResponseCache() if use_cache else None
+        self.fresh_answers = fresh_answers
+    
     def format_prompt(self, user_input):
         """格式化输入提示"""
-        system_prompt = "你是一个可爱活泼的桌面宠物，要用温暖幽默的语气回复主人，在对话中要加入可爱的动作描写。"
+        system_prompt = ("你是一个可爱活泼的桌面宠物，要用温暖幽默的语气回复主人，在对话中要加入可爱的动作描写。"
+                         "请用JSON回复，格式为 {\"text\": 回复内容, \"action\": 动作标签}。"
+                         "动作标签：主人难过时用comfort，主人需要鼓励时用encourage，"
+                         "主人心情低落想开心时用cheer_up，其他情况用none。")
+        
+        # 召回与当前输入相关的长期记忆
+        if self.memory:
+            memories = self.memory.recall(user_input, exclude={m["content"] for m in self.history})
+            if memories:
+                system_prompt += "\n你记得主人以前说过：\n" + "\n".join(f"- {m}" for m in memories)
         
         # 构建完整的提示
         messages = [
@@ -34,37 +208,211 @@ class LlamaChatManager:
         
         return messages
     
-    def get_response(self, user_input):
-        """获取模型回应"""
+    def parse_reply(self, content):
+        """解析模型输出的JSON；输出被截断时尽量取出已生成的回复文本"""
         try:
+            data = json.loads(content)
+            return ChatReply(data["text"].strip(), data.get("action", "none"))
+        except (ValueError, KeyError, TypeError, AttributeError):
+            pass
+        
+        match = TEXT_FIELD.search(content)
+        if match:
+            # 去掉被截断的 \uXXXX 转义后再按JSON字符串解码
+            fragment = re.sub(r'\\u[0-9a-fA-F]{0,3}$', '', match.group(1))
+            try:
+                text = json.loads(f'"{fragment}"')
+            except ValueError:
+                text = fragment
+        elif content.lstrip().startswith("{"):
+            text = ""  # 连 text 字段都没有生成出来
+        else:
+            text = content
+        action = ACTION_FIELD.search(content)
+        return ChatReply(text.strip(), action.group(1) if action else "none", complete=False)
+    
+    def generate(self, messages, route="large", turn=None):
+        """用指定路由的模型生成回复，返回 (回复内容, 置信度)
+
+        以流式方式生成，以便分别统计预填充（首token延迟）和解码速度。
+        """
+        model = self.small_model if route == "small" and self.small_model else self.model
+        grammar = self.grammar
+        meter = ConfidenceMeter()
+        local_kwargs = {}
+        if not isinstance(model, ChatServerClient):
+            # 只有本地模型才需要 llama_cpp 的语法对象和 logits 处理器
+            from llama_cpp import LlamaGrammar, LogitsProcessorList
+            if isinstance(grammar, str):
+                grammar = LlamaGrammar.from_string(grammar, verbose=False)
+            local_kwargs["logits_processor"] = LogitsProcessorList([meter])
+        start_time = time.perf_counter()
+        first_token_time = None
+        parts = []
+        for chunk in model.create_chat_completion(
+            messages=messages,
+            temperature=0.7,
+            top_p=0.9,
+            max_tokens=512,
+            grammar=grammar,
+            stream=True,
+            **local_kwargs
+        ):
+            choices = chunk.get("choices")
+            delta = choices[0].get("delta", {}).get("content") if choices else None
+            if delta:
+                if first_token_time is None:
+                    first_token_time = time.perf_counter()
+                    if turn:
+                        turn.mark("first_token")
+                parts.append(delta)
+        end_time = time.perf_counter()
+        content = "".join(parts)
+        
+        # 首token之后的都算解码
+        first_token_time = first_token_time or end_time
+        tokens = self.count_tokens(model, content, len(parts))
+        decode_tokens = max(0, tokens - 1)
+        decode_seconds = end_time - first_token_time
+        tokens_per_sec = decode_tokens / decode_seconds if decode_seconds > 0 else 0.0
+        if turn:
+            turn.record("prefill", (first_token_time - start_time) * 1000)
+            turn.record("decode", decode_seconds * 1000)
+            turn.set("ttft_ms", (first_token_time - start_time) * 1000)
+            turn.set("decode_tps", tokens_per_sec)
+            turn.set("tokens", tokens)
+        
+        if model is self.model:
+            self.decode_tokens += decode_tokens
+            self.decode_seconds += decode_seconds
+            self.last_tokens_per_sec = tokens_per_sec
+            if self.draft_model:
+                self.draft_model.end_generation()
+        
+        return content, meter.value
+    
+    def count_tokens(self, model, content, chunks):
+        """生成内容的实际token数
+
+        流式块与token并不一一对应：服务端可能把多个token合并成一块，
+        一个汉字也常被拆成多个token，按块计数会低估解码速度。分词失败时退回块数。
+        """
+        if not content:
+            return 0
+        try:
+            return len(model.tokenize(content.encode("utf-8"), add_bos=False, special=True))
+        except Exception as e:
+            print(f"统计token数出错: {e}")
+            return chunks
+    
+    def decode_stats(self):
+        """大模型的生成速度和投机解码接受率"""
+        stats = {
+            "tokens_per_sec": self.last_tokens_per_sec,
+            "avg_tokens_per_sec": self.decode_tokens / self.decode_seconds if self.decode_seconds else 0.0,
+        }
+        if self.draft_model:
+            stats["drafted"] = self.draft_model.drafted
+            stats["accepted"] = self.draft_model.accepted
+            stats["acceptance_rate"] = self.draft_model.acceptance_rate
+        return stats
+    
+    def process_input(self, user_input, turn=None):
+        """获取带动作标签的模型回应
+
+        turn: 调用方的耗时记录（如语音轮次）；为None时本方法自行记录并结束
+        """
+        own_turn = turn is None
+        if own_turn:
+            turn = tracer.start_turn("chat")
+        try:
+            # 先查缓存
+            if self.cache and not self.fresh_answers:
+                cached = self.cache.get(user_input, self.history)
+                if cached is not None:
+                    print("命中回复缓存")
+                    turn.set("cache_hit", True)
+                    reply = ChatReply.from_dict(cached)
+                    self.update_history(user_input, reply.text, reply.type)
+                    return reply
+            
             # 准备输入
-            messages = self.format_prompt(user_input)
+            with turn.span("prompt_build"):
+                messages = self.format_prompt(user_input)
             
-            # 生成回应
+            # 生成回应：简短闲聊先交给小模型，置信度低时升级到大模型
             start_time = time.time()
-            response = self.model.create_chat_completion(
-                messages=messages,
-                temperature=0.7,
-                top_p=0.9,
-                max_tokens=512
-            )
+            route = self.router.route(user_input) if self.router else "large"
+            escalated = False
+            try:
+                content, confidence = self.generate(messages, route, turn)
+            except Exception as e:
+                if route != "small":
+                    raise
+                # 小模型出错（如提示超出上下文）时交给大模型，而不是直接回复出错
+                print(f"小模型生成出错({e})，升级到大模型")
+                content, confidence = None, 0.0
+            if route == "small" and (content is None or self.router.should_escalate(confidence)):
+                if content is not None:
+                    print(f"小模型置信度过低({confidence:.2f})，升级到大模型")
+                content, confidence = self.generate(messages, "large", turn)
+                escalated = True
+            if self.router:
+                self.router.record(route, escalated)
+            turn.set("route", "escalated" if escalated else route)
             end_time = time.time()
             
-            print(f"生成回应耗时: {end_time - start_time:.2f}秒")
+            print(f"生成回应耗时: {end_time - start_time:.2f}秒 (路由: {route})")
+            if self.draft_model and (route == "large" or escalated):
+                stats = self.decode_stats()
+                print(f"解码速度: {stats['tokens_per_sec']:.1f} tokens/s, "
+                      f"草稿接受率: {stats['acceptance_rate']:.0%}")
             
             # 提取助手的回复部分
-            assistant_response = response["choices"][0]["message"]["content"]
-            
-            # 更新对话历史
-            self.history.append({"role": "user", "content": user_input})
-            self.history.append({"role": "assistant", "content": assistant_response})
+            reply = self.parse_reply(content)
+            if not reply.text:
+                raise ValueError(f"无法从模型输出中解析回复: {content[:80]!r}")
+            if not reply.complete:
+                print("模型输出的JSON不完整，已取出其中的回复文本")
             
-            # 保持历史长度在合理范围
-            if len(self.history) > 20:  # 保留最近10轮对话
-                self.history = self.history[-20:]
+            # 写入缓存（键使用本轮之前的上下文），不完整的回复不缓存
+            if self.cache and reply.complete:
+                self.cache.put(user_input, self.history, reply.to_dict())
             
-            return assistant_response
+            # 更新对话历史
+            self.update_history(user_input, reply.text, reply.type)
             
+            return reply
+        
         except Exception as e:
             print(f"生成回应时出错: {e}")
-            return "*揉揉眼睛* 抱歉主人，我有点累了，我们待会再聊吧～" 
\ No newline at end of file
+            turn.set("error", str(e))
+            return ChatReply("*揉揉眼睛* 抱歉主人，我有点累了，我们待会再聊吧～")
+        
+        finally:
+            if own_turn:
+                tracer.finish(turn)
+    
+    def warm_up(self):
+        """预热：运行一次极短的生成，让 mmap 映射的权重页提前调入内存"""
+        for model in (self.model, self.small_model):
+            if model:
+                model.create_completion("你好", max_tokens=1)
+    
+    def get_response(self, user_input):
+        """获取模型回应文本"""
+        return self.process_input(user_input).text
+    
+    def update_history(self, user_input, assistant_response, action=None):
+        """更新对话历史，并异步写入对话记录"""
+        if self.store:
+            self.store.add_turn(user_input, assistant_response, action)
+            if self.memory:
+                self.memory.schedule_sync()
+        
+        self.history.append({"role": "user", "content": user_input})
+        self.history.append({"role": "assistant", "content": assistant_response})
+        
+        # 保持历史长度在合理范围
+        if len(self.history) > 20:  # 保留最近10轮对话
+            self.history = self.history[-20:]
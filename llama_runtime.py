@@ -0,0 +1,194 @@
+"""llama 运行参数配置与自动调优
+
+用法:
+    python llama_runtime.py show        查看当前生效的参数
+    python llama_runtime.py autotune    在本机上扫描线程数和批大小，写入最佳配置
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+DEFAULT_CONFIG_FILE = "llama_config.json"
+
+# None 表示运行时自动决定
+DEFAULT_RUNTIME = {
+    "n_ctx": 4096,
+    "n_gpu_layers": None,     # 有GPU时全部卸载，否则为0
+    "n_threads": None,        # 解码线程数，默认取物理核心数的估计值
+    "n_threads_batch": None,  # 预填充线程数，默认与逻辑核心数相同
+    "n_batch": 512,
+    "use_mmap": True,
+    "use_mlock": False,
+    "flash_attn": False,
+    "type_k": "f16",          # KV 缓存类型：f32/f16/q8_0/q5_1/q5_0/q4_1/q4_0
+    "type_v": "f16",
+}
+
+# ggml_type 枚举值
+KV_CACHE_TYPES = {
+    "f32": 0,
+    "f16": 1,
+    "q4_0": 2,
+    "q4_1": 3,
+    "q5_0": 6,
+    "q5_1": 7,
+    "q8_0": 8,
+}
+
+def load_runtime_config(config_file=DEFAULT_CONFIG_FILE):
+    """读取配置文件并与默认值合并"""
+    config = dict(DEFAULT_RUNTIME)
+    if os.path.exists(config_file):
+        try:
+            with open(config_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            config.update({k: v for k, v in data.get("runtime", {}).items() if k in DEFAULT_RUNTIME})
+        except Exception as e:
+            print(f"读取运行参数配置出错: {e}")
+    return config
+
+def save_runtime_config(config, config_file=DEFAULT_CONFIG_FILE, extra=None):
+    """写回配置文件，保留文件中的其他字段"""
+    data = {}
+    if os.path.exists(config_file):
+        with open(config_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    data["runtime"] = {k: config[k] for k in DEFAULT_RUNTIME if k in config}
+    if extra:
+        data.update(extra)
+    with open(config_file, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+def gpu_available():
+    """llama.cpp 是否编译了GPU卸载支持"""
+    try:
+        import llama_cpp
+        return bool(llama_cpp.llama_supports_gpu_offload())
+    except Exception:
+        return False
+
+def llama_kwargs(config, **overrides):
+    """把配置转换为 Llama(...) 的参数，解析自动值"""
+    config = dict(config, **overrides)
+    logical = os.cpu_count() or 4
+
+    n_gpu_layers = config["n_gpu_layers"]
+    if n_gpu_layers is None:
+        n_gpu_layers = -1 if gpu_available() else 0
+
+    type_k = KV_CACHE_TYPES.get(config["type_k"], KV_CACHE_TYPES["f16"])
+    type_v = KV_CACHE_TYPES.get(config["type_v"], KV_CACHE_TYPES["f16"])
+    if type_v != KV_CACHE_TYPES["f16"] and not config["flash_attn"]:
+        # llama.cpp 只有在 flash attention 下才支持量化的 V 缓存
+        print("量化的V缓存需要开启flash_attn，已回退为f16")
+        type_v = KV_CACHE_TYPES["f16"]
+
+    return {
+        "n_ctx": config["n_ctx"],
+        "n_gpu_layers": n_gpu_layers,
+        "n_threads": config["n_threads"] or max(1, logical // 2),
+        "n_threads_batch": config["n_threads_batch"] or logical,
+        "n_batch": config["n_batch"],
+        "use_mmap": config["use_mmap"],
+        "use_mlock": config["use_mlock"],
+        "flash_attn": config["flash_attn"],
+        "type_k": type_k,
+        "type_v": type_v,
+    }
+
+def thread_candidates():
+    """线程数候选值"""
+    logical = os.cpu_count() or 4
+    values = {1, 2, 4, logical // 2, logical}
+    values.update(range(6, logical, 4))
+    return sorted(v for v in values if 0 < v <= logical)
+
+def measure(model_path, config, prompt_tokens=256, decode_tokens=64):
+    """测量预填充和解码速度 (tokens/s)"""
+    from llama_cpp import Llama
+    llm = Llama(model_path=model_path, verbose=False, **llama_kwargs(config))
+    try:
+        # 固定长度的预填充输入
+        tokens = llm.tokenize("你是一只可爱的桌面宠物，".encode("utf-8") * prompt_tokens)[:prompt_tokens]
+
+        llm.reset()
+        start = time.perf_counter()
+        llm.eval(tokens)
+        prefill_tps = len(tokens) / (time.perf_counter() - start)
+
+        llm.reset()
+        llm.eval(tokens[:16])
+        start = time.perf_counter()
+        for _ in range(decode_tokens):
+            token = llm.sample(top_k=1, temp=0.0)
+            llm.eval([token])
+        decode_tps = decode_tokens / (time.perf_counter() - start)
+        return prefill_tps, decode_tps
+    finally:
+        llm.close()
+
+def autotune(model_path, config_file=DEFAULT_CONFIG_FILE, threads=None, batches=None):
+    """扫描线程数与批大小，分别为解码和预填充选出最快的组合"""
+    config = load_runtime_config(config_file)
+    threads = threads or thread_candidates()
+    batches = batches or [64, 128, 256, 512, 1024]
+    results = []
+
+    # 解码速度主要取决于 n_threads
+    best_decode = (0.0, config["n_threads"])
+    for n in threads:
+        trial = dict(config, n_threads=n, n_threads_batch=n)
+        prefill_tps, decode_tps = measure(model_path, trial)
+        results.append({"n_threads": n, "n_batch": trial["n_batch"],
+                        "prefill_tps": prefill_tps, "decode_tps": decode_tps})
+        print(f"threads={n:<3} batch={trial['n_batch']:<5} 预填充 {prefill_tps:7.1f} tok/s  解码 {decode_tps:6.1f} tok/s")
+        if decode_tps > best_decode[0]:
+            best_decode = (decode_tps, n)
+
+    # 预填充速度取决于 n_threads_batch 和 n_batch
+    best_prefill = (0.0, config["n_threads_batch"], config["n_batch"])
+    for n in threads:
+        for batch in batches:
+            trial = dict(config, n_threads=best_decode[1], n_threads_batch=n, n_batch=batch)
+            prefill_tps, decode_tps = measure(model_path, trial, decode_tokens=8)
+            results.append({"n_threads_batch": n, "n_batch": batch, "prefill_tps": prefill_tps})
+            print(f"threads_batch={n:<3} batch={batch:<5} 预填充 {prefill_tps:7.1f} tok/s")
+            if prefill_tps > best_prefill[0]:
+                best_prefill = (prefill_tps, n, batch)
+
+    config.update(n_threads=best_decode[1], n_threads_batch=best_prefill[1], n_batch=best_prefill[2])
+    if config["n_gpu_layers"] is None and not gpu_available():
+        config["n_gpu_layers"] = 0
+    save_runtime_config(config, config_file, extra={"autotune": {
+        "model_path": model_path,
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "decode_tps": best_decode[0],
+        "prefill_tps": best_prefill[0],
+        "trials": results,
+    }})
+    print(f"最佳配置: n_threads={config['n_threads']} n_threads_batch={config['n_threads_batch']} "
+          f"n_batch={config['n_batch']}，已写入 {config_file}")
+    return config
+
+def main():
+    parser = argparse.ArgumentParser(description="llama 运行参数")
+    parser.add_argument("--config", default=DEFAULT_CONFIG_FILE)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("show", help="查看当前生效的参数")
+    tune = sub.add_parser("autotune", help="扫描线程数和批大小")
+    tune.add_argument("--model", default="models/Llama3-q4_k_m-v1.gguf")
+    tune.add_argument("--threads", type=int, nargs="+")
+    tune.add_argument("--batches", type=int, nargs="+")
+    args = parser.parse_args()
+
+    if args.command == "show":
+        config = load_runtime_config(args.config)
+        print(json.dumps({"config": config, "llama_kwargs": llama_kwargs(config)}, ensure_ascii=False, indent=2))
+    else:
+        autotune(args.model, args.config, args.threads, args.batches)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+import os
+import json
+import threading
+import numpy as np
+
+class VectorIndex:
+    """紧凑的向量索引
+
+    嵌入先经固定种子的随机投影降到 dim 维并归一化，以 float32 追加写入文件，
+    查询时通过 memmap 映射，一次矩阵向量乘法加 argpartition 取 top-k。
+    10万条 256 维向量约 100MB，检索耗时在毫秒级。
+    model 标识生成嵌入的模型，换了模型后旧向量不可比，需要重建索引。
+    """
+    def __init__(self, path="data/memory", dim=256, seed=20240501, model=None):
+        self.path = path
+        self.dim = dim
+        self.seed = seed
+        self.model = model
+        self.vectors_file = os.path.join(path, "vectors.f32")
+        self.ids_file = os.path.join(path, "ids.i64")
+        self.meta_file = os.path.join(path, "meta.json")
+        os.makedirs(path, exist_ok=True)
+
+        self.count = 0
+        self.input_dim = None
+        self.last_id = 0
+        if os.path.exists(self.meta_file):
+            with open(self.meta_file, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta.get("dim") == dim and meta.get("seed") == seed and meta.get("model") == model:
+                self.count = meta["count"]
+                self.input_dim = meta["input_dim"]
+                self.last_id = meta["last_id"]
+            else:
+                print("记忆索引参数已变化，将重新建立索引")
+                self._truncate()
+        else:
+            self._truncate()
+        self._repair()
+
+        self._projection = None
+        self._vectors = None
+        self._ids = None
+        self._mapped_count = -1
+        self._lock = threading.Lock()
+
+    def _truncate(self):
+        for file in (self.vectors_file, self.ids_file):
+            if os.path.exists(file):
+                os.remove(file)
+
+    def _repair(self):
+        """丢弃上次异常退出时写了一半的数据，使文件长度与 meta 一致"""
+        for file, size in ((self.vectors_file, self.count * self.dim * 4), (self.ids_file, self.count * 8)):
+            if os.path.exists(file) and os.path.getsize(file) > size:
+                os.truncate(file, size)
+
+    def _project(self, embeddings):
+        """随机投影降维并归一化"""
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if embeddings.ndim == 1:
+            embeddings = embeddings[None, :]
+        if self.input_dim is None:
+            self.input_dim = embeddings.shape[1]
+        if self._projection is None:
+            rng = np.random.default_rng(self.seed)
+            self._projection = rng.standard_normal((self.input_dim, self.dim)).astype(np.float32)
+        projected = embeddings @ self._projection
+        norms = np.linalg.norm(projected, axis=1, keepdims=True)
+        return projected / np.maximum(norms, 1e-12)
+
+    def add(self, ids, embeddings):
+        """追加一批向量，ids 需单调递增"""
+        if not len(ids):
+            return
+        vectors = self._project(embeddings)
+        with self._lock:
+            with open(self.vectors_file, 'ab') as f:
+                f.write(vectors.astype(np.float32).tobytes())
+            with open(self.ids_file, 'ab') as f:
+                f.write(np.asarray(ids, dtype=np.int64).tobytes())
+            self.count += len(ids)
+            self.last_id = int(ids[-1])
+            with open(self.meta_file, 'w', encoding='utf-8') as f:
+                json.dump({"dim": self.dim, "seed": self.seed, "model": self.model, "input_dim": self.input_dim,
+                           "count": self.count, "last_id": self.last_id}, f)
+
+    def _mapped(self):
+        """按当前条数重新映射文件（只在有新增时才重新映射）"""
+        if self._mapped_count != self.count:
+            self._vectors = np.memmap(self.vectors_file, dtype=np.float32, mode='r',
+                                      shape=(self.count, self.dim))
+            self._ids = np.memmap(self.ids_file, dtype=np.int64, mode='r', shape=(self.count,))
+            self._mapped_count = self.count
+        return self._vectors, self._ids
+
+    def search(self, embedding, k=3):
+        """返回 [(id, 相似度)]，按相似度降序"""
+        with self._lock:
+            if self.count == 0:
+                return []
+            vectors, ids = self._mapped()
+        query = self._project(embedding)[0]
+        scores = vectors @ query
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(ids[i]), float(scores[i])) for i in top]
+
+class LocalEmbedder:
+    """在本进程加载专用的小型嵌入模型（GGUF），不与聊天模型共用
+
+    池化方式使用 GGUF 元数据中记录的类型（如 bge 系列为 CLS），与模型训练时一致。
+    """
+    def __init__(self, model_path, runtime_kwargs=None):
+        from llama_cpp import Llama
+        # 名称中带上池化方式：之前按 MEAN 池化建立的索引与现在的向量不可比，需要重建
+        self.name = f"{os.path.basename(model_path)}#pooling=gguf"
+        self.model = Llama(
+            model_path=model_path,
+            embedding=True,
+            verbose=False,
+            **(runtime_kwargs or {})
+        )
+
+    def embed(self, texts):
+        return self.model.embed(texts)
+
+class RetrievalMemory:
+    """长期记忆：为主人说过的话建立嵌入索引，按相关度召回
+
+    embedder 提供 embed(texts) -> 向量列表，通常是 LocalEmbedder。
+    embedder_name 记入索引，换了嵌入模型时重建索引。
+    """
+    def __init__(self, store, embedder, embedder_name, index_path="data/memory",
+                 top_k=3, min_score=0.35, recall_timeout=0.2):
+        self.store = store
+        self.top_k = top_k
+        self.min_score = min_score
+        self.recall_timeout = recall_timeout
+        self.index = VectorIndex(index_path, model=embedder_name)
+        self.embedder = embedder
+        self._embed_lock = threading.Lock()
+        self._sync_thread = None
+
+    def embed(self, texts, timeout=-1):
+        """同一时间只让一个线程使用嵌入模型；timeout 内拿不到时返回None"""
+        if not self._embed_lock.acquire(timeout=timeout):
+            return None
+        try:
+            return self.embedder.embed(texts)
+        finally:
+            self._embed_lock.release()
+
+    def sync(self, batch=8):
+        """为对话记录中尚未索引的主人消息建立向量"""
+        self.store.flush()
+        ids, texts = [], []
+        for message in self.store.iter_after(self.index.last_id):
+            if message["role"] != "user":
+                continue
+            ids.append(message["id"])
+            texts.append(message["content"])
+            if len(ids) >= batch:
+                self.index.add(ids, self.embed(texts))
+                ids, texts = [], []
+        if ids:
+            self.index.add(ids, self.embed(texts))
+
+    def schedule_sync(self):
+        """在后台线程增量更新索引"""
+        if self._sync_thread and self._sync_thread.is_alive():
+            return
+        self._sync_thread = threading.Thread(target=self._safe_sync, daemon=True)
+        self._sync_thread.start()
+
+    def _safe_sync(self):
+        try:
+            self.sync()
+        except Exception as e:
+            print(f"更新记忆索引出错: {e}")
+
+    def recall(self, query, exclude=()):
+        """召回与当前输入最相关的几条旧消息文本
+
+        在界面线程调用：后台建索引正占用嵌入模型时最多等 recall_timeout 秒，
+        超时或出错时本轮不召回，而不是让对话卡住。
+        """
+        if self.index.count == 0:
+            return []
+        try:
+            embeddings = self.embed([query], timeout=self.recall_timeout)
+        except Exception as e:
+            print(f"召回记忆出错: {e}")
+            return []
+        if embeddings is None:
+            print("记忆索引正在更新，本轮跳过召回")
+            return []
+        hits = self.index.search(embeddings[0], self.top_k * 2)
+        hits = [message_id for message_id, score in hits if score >= self.min_score]
+        memories = []
+        for message in self.store.get(hits):
+            if message["content"] not in exclude and message["content"] != query:
+                memories.append(message["content"])
+            if len(memories) >= self.top_k:
+                break
+        return memories
@@ -0,0 +1,24 @@
+import time
+from PyQt6.QtCore import QThread, pyqtSignal
+
+class ModelLoader(QThread):
+    """在后台线程加载聊天模型并预热，避免阻塞宠物显示"""
+    loaded = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, parent=None, **manager_kwargs):
+        super().__init__(parent)
+        self.manager_kwargs = manager_kwargs
+
+    def run(self):
+        try:
+            start_time = time.time()
+            # 延迟导入：llama_cpp 只在工作线程里加载
+            from llama_chat_manager import LlamaChatManager
+            manager = LlamaChatManager(**self.manager_kwargs)
+            manager.warm_up()
+            print(f"模型加载及预热耗时: {time.time() - start_time:.2f}秒")
+            self.loaded.emit(manager)
+        except Exception as e:
+            print(f"加载模型出错: {e}")
+            self.failed.emit(str(e))
@@ -0,0 +1,55 @@
+import numpy as np
+from response_cache import ResponseCache
+
+# 出现这些词时说明问题较复杂，直接交给大模型
+ESCALATE_KEYWORDS = [
+    "为什么", "怎么", "如何", "解释", "分析", "建议", "计划", "总结", "翻译",
+    "代码", "程序", "写一", "帮我", "故事", "比较", "区别", "原理", "步骤",
+]
+
+class ConfidenceMeter:
+    """logits 处理器：记录每一步的最大 softmax 概率，作为生成置信度"""
+    def __init__(self):
+        self.probs = []
+
+    def reset(self):
+        self.probs = []
+
+    def __call__(self, input_ids, scores):
+        # 只观察不修改 logits
+        s = scores - np.max(scores)
+        self.probs.append(float(1.0 / np.sum(np.exp(s))))
+        return scores
+
+    @property
+    def value(self):
+        """平均置信度，没有记录时视为完全确定"""
+        if not self.probs:
+            return 1.0
+        return sum(self.probs) / len(self.probs)
+
+class ModelRouter:
+    """根据输入长度、关键词和置信度在小模型与大模型之间路由"""
+    def __init__(self, max_chars=16, keywords=None, min_confidence=0.55):
+        self.max_chars = max_chars
+        self.keywords = keywords if keywords is not None else ESCALATE_KEYWORDS
+        self.min_confidence = min_confidence
+        self.stats = {"small": 0, "large": 0, "escalated": 0}
+
+    def route(self, user_input):
+        """选择模型：'small' 或 'large'"""
+        text = ResponseCache.normalize(user_input)
+        if len(text) > self.max_chars:
+            return "large"
+        if any(keyword in user_input for keyword in self.keywords):
+            return "large"
+        return "small"
+
+    def should_escalate(self, confidence):
+        """小模型置信度过低时升级到大模型"""
+        return confidence < self.min_confidence
+
+    def record(self, route, escalated=False):
+        self.stats[route] += 1
+        if escalated:
+            self.stats["escalated"] += 1
@@ -0,0 +1,187 @@
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+import atexit
+import unicodedata
+from collections import OrderedDict
+
+class ResponseCache:
+    """LLM回复缓存：支持精确匹配和基于字符n-gram MinHash的近似匹配"""
+
+    _MERSENNE_PRIME = (1 << 61) - 1
+
+    def __init__(self, cache_file="cache/response_cache.json", max_entries=512,
+                 ttl=7 * 24 * 3600, near_duplicate=True, similarity_threshold=0.8,
+                 num_perm=64, ngram_size=2, save_interval=30):
+        self.cache_file = cache_file
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.near_duplicate = near_duplicate
+        self.similarity_threshold = similarity_threshold
+        self.num_perm = num_perm
+        self.ngram_size = ngram_size
+        self.save_interval = save_interval
+
+        # MinHash 的随机排列参数，固定种子保证重启后签名一致
+        rng = random.Random(20240501)
+        self._perms = [(rng.randrange(1, self._MERSENNE_PRIME), rng.randrange(0, self._MERSENNE_PRIME))
+                       for _ in range(num_perm)]
+
+        # key -> entry，按最近使用顺序排列（LRU）
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._dirty = False
+        self._last_save = time.time()
+        self._lock = threading.Lock()
+
+        self.load()
+        atexit.register(self.save)
+
+    @staticmethod
+    def normalize(text):
+        """归一化用户输入：全角转半角、小写、去掉标点空白"""
+        text = unicodedata.normalize("NFKC", text).lower()
+        return "".join(ch for ch in text if unicodedata.category(ch)[0] not in "PZSC")
+
+    @staticmethod
+    def context_hash(history, turns=2):
+        """对最近几轮对话做短哈希，作为缓存键的一部分"""
+        recent = history[-turns * 2:] if turns > 0 else []
+        data = json.dumps(recent, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha1(data.encode("utf-8")).hexdigest()[:8]
+
+    def _shingles(self, text):
+        n = self.ngram_size
+        if len(text) <= n:
+            return {text}
+        return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+    def signature(self, text):
+        """计算字符n-gram的MinHash签名"""
+        hashes = [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little")
+                  for s in self._shingles(text)]
+        p = self._MERSENNE_PRIME
+        return [min((a * h + b) % p for h in hashes) for a, b in self._perms]
+
+    @staticmethod
+    def similarity(sig1, sig2):
+        """由两个签名估计Jaccard相似度"""
+        if not sig1 or len(sig1) != len(sig2):
+            return 0.0
+        return sum(1 for x, y in zip(sig1, sig2) if x == y) / len(sig1)
+
+    def _expired(self, entry, now):
+        return self.ttl is not None and now - entry["time"] > self.ttl
+
+    def get(self, user_input, history):
+        """查找缓存，未命中返回 None"""
+        norm = self.normalize(user_input)
+        if not norm:
+            return None
+        ctx = self.context_hash(history)
+        key = f"{ctx}:{norm}"
+        now = time.time()
+
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry and self._expired(entry, now):
+                del self.entries[key]
+                self._dirty = True
+                entry = None
+
+            # 近似匹配：只在同一上下文里比较签名，过短的输入只做精确匹配
+            if entry is None and self.near_duplicate and len(norm) > self.ngram_size:
+                sig = self.signature(norm)
+                best_key, best_score = None, self.similarity_threshold
+                for k, e in self.entries.items():
+                    if e["ctx"] != ctx or self._expired(e, now):
+                        continue
+                    score = self.similarity(sig, e["sig"])
+                    if score >= best_score:
+                        best_key, best_score = k, score
+                if best_key is not None:
+                    key, entry = best_key, self.entries[best_key]
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry["value"]
+
+    def put(self, user_input, history, value):
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        norm = self.normalize(user_input)
+        if not norm:
+            return
+        ctx = self.context_hash(history)
+        key = f"{ctx}:{norm}"
+
+        with self._lock:
+            self.entries[key] = {
+                "value": value,
+                "time": time.time(),
+                "ctx": ctx,
+                "sig": self.signature(norm) if self.near_duplicate else [],
+            }
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self._dirty = True
+
+        if time.time() - self._last_save > self.save_interval:
+            self.save()
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self.entries.clear()
+            self._dirty = True
+        self.save()
+
+    def load(self):
+        """从磁盘加载缓存，丢弃已过期的条目"""
+        if not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("num_perm") != self.num_perm or data.get("ngram_size") != self.ngram_size:
+                # 签名参数变化后旧签名无法比较，只保留精确匹配部分
+                for entry in data.get("entries", {}).values():
+                    entry["sig"] = []
+            now = time.time()
+            for key, entry in data.get("entries", {}).items():
+                if not self._expired(entry, now):
+                    self.entries[key] = entry
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            print(f"已加载 {len(self.entries)} 条回复缓存")
+        except Exception as e:
+            print(f"加载回复缓存出错: {e}")
+
+    def save(self):
+        """将缓存原子地写回磁盘"""
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {
+                "num_perm": self.num_perm,
+                "ngram_size": self.ngram_size,
+                "entries": dict(self.entries),
+            }
+            self._dirty = False
+            self._last_save = time.time()
+        try:
+            os.makedirs(os.path.dirname(self.cache_file) or ".", exist_ok=True)
+            tmp_file = f"{self.cache_file}.tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_file, self.cache_file)
+        except Exception as e:
+            print(f"保存回复缓存出错: {e}")
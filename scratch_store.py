@@ -0,0 +1,128 @@
+import os
+import time
+import uuid
+import json
+import threading
+from llama_runtime import DEFAULT_CONFIG_FILE
+
+RAM_ROOT = "/dev/shm"
+
+# llama_config.json 中 scratch 部分的默认值
+DEFAULT_SCRATCH = {
+    "ram": False,                      # 放在内存盘(/dev/shm)
+    "max_bytes": 64 * 1024 * 1024,     # 临时文件总大小上限
+    "max_age": 3600,                   # 超过该秒数的文件会被清理
+}
+
+def load_scratch_config(config_file=DEFAULT_CONFIG_FILE):
+    """读取临时文件配置并与默认值合并"""
+    config = dict(DEFAULT_SCRATCH)
+    if os.path.exists(config_file):
+        try:
+            with open(config_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            config.update({k: v for k, v in data.get("scratch", {}).items() if k in DEFAULT_SCRATCH})
+        except Exception as e:
+            print(f"读取临时文件配置出错: {e}")
+    return config
+
+class ScratchStore:
+    """临时文件（录音、识别结果、合成语音）的生命周期管理
+
+    - 文件名带随机后缀，同一秒内多次录音也不会冲突
+    - 后台线程定期清理：超过 max_age 秒的文件删除，总大小超过 max_bytes 时从最旧的开始删除
+    - ram=True 时放在内存盘(/dev/shm)，避免频繁读写磁盘；没有内存盘的系统仍使用 root
+    """
+    def __init__(self, root="temp", max_bytes=64 * 1024 * 1024, max_age=3600, sweep_interval=60, ram=False):
+        if ram:
+            if os.path.isdir(RAM_ROOT):
+                root = os.path.join(RAM_ROOT, "taidi")
+            else:
+                print(f"系统没有内存盘，临时文件仍保存在 {root}")
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.sweep_interval = sweep_interval
+        os.makedirs(self.root, exist_ok=True)
+
+        self._active = set()  # 已分配但还未释放的文件，按大小淘汰时跳过
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+        # 启动时先清理上次运行留下的文件
+        self.sweep()
+        self._thread = threading.Thread(target=self._sweep_loop, daemon=True)
+        self._thread.start()
+
+    def path(self, prefix, suffix):
+        """分配一个唯一的临时文件路径"""
+        name = f"{prefix}_{time.strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:8]}{suffix}"
+        path = os.path.join(self.root, name)
+        with self._lock:
+            self._active.add(path)
+        return path
+
+    def release(self, path):
+        """用完后删除文件，以及以它为前缀的附属文件（如 whisper 生成的 xxx.wav.txt）"""
+        if not path:
+            return
+        with self._lock:
+            self._active.discard(path)
+        for candidate in (path, f"{path}.txt"):
+            try:
+                os.remove(candidate)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"删除临时文件出错 {candidate}: {e}")
+
+    def _entries(self):
+        """[(修改时间, 大小, 路径)]，按修改时间从旧到新"""
+        entries = []
+        try:
+            with os.scandir(self.root) as it:
+                for entry in it:
+                    if entry.is_file():
+                        try:
+                            stat = entry.stat()
+                        except OSError:
+                            continue
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except OSError as e:
+            print(f"读取临时目录出错: {e}")
+        entries.sort()
+        return entries
+
+    def sweep(self):
+        """按时间和总大小淘汰文件，返回删除的文件数"""
+        now = time.time()
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        with self._lock:
+            active = set(self._active)
+
+        removed = 0
+        for mtime, size, path in entries:
+            expired = now - mtime > self.max_age
+            over_quota = total > self.max_bytes and path not in active
+            if not (expired or over_quota):
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+    def _sweep_loop(self):
+        while not self._stop.wait(self.sweep_interval):
+            self.sweep()
+
+    def usage(self):
+        """当前的文件数和总大小"""
+        entries = self._entries()
+        return {"files": len(entries), "bytes": sum(size for _, size, _ in entries)}
+
+    def close(self):
+        self._stop.set()
@@ -0,0 +1,67 @@
+import numpy as np
+from llama_cpp.llama_speculative import LlamaDraftModel, LlamaPromptLookupDecoding
+
+class GGUFDraftModel(LlamaDraftModel):
+    """用一个小的GGUF模型贪心生成草稿token（词表需与主模型一致）"""
+    def __init__(self, model, num_pred_tokens=8):
+        self.model = model
+        self.num_pred_tokens = num_pred_tokens
+
+    def __call__(self, input_ids, **kwargs):
+        draft = []
+        # generate 会复用与上次输入相同的前缀，只对新增部分做预填充
+        for token in self.model.generate(input_ids.tolist(), top_k=1, temp=0.0, reset=True):
+            draft.append(token)
+            if len(draft) >= self.num_pred_tokens:
+                break
+        return np.array(draft, dtype=np.intc)
+
+class TrackingDraftModel(LlamaDraftModel):
+    """包装草稿模型，统计草稿token的接受率
+
+    主模型每一步都会把已接受的前缀传给草稿模型，比较上一次的草稿与
+    新前缀中多出来的部分，即可得到被接受的草稿token数。
+    """
+    def __init__(self, draft_model):
+        self.draft_model = draft_model
+        self.drafted = 0
+        self.accepted = 0
+        self._last_len = 0
+        self._last_draft = None
+
+    def __call__(self, input_ids, **kwargs):
+        if self._last_draft is not None and len(input_ids) > self._last_len:
+            new_tokens = input_ids[self._last_len:self._last_len + len(self._last_draft)]
+            matched = 0
+            for drafted, actual in zip(self._last_draft, new_tokens):
+                if drafted != actual:
+                    break
+                matched += 1
+            self.drafted += len(self._last_draft)
+            self.accepted += matched
+
+        draft = self.draft_model(input_ids, **kwargs)
+        self._last_len = len(input_ids)
+        self._last_draft = draft if len(draft) else None
+        return draft
+
+    def end_generation(self):
+        """一次生成结束，丢弃尚未验证的最后一份草稿"""
+        self._last_draft = None
+
+    @property
+    def acceptance_rate(self):
+        return self.accepted / self.drafted if self.drafted else 0.0
+
+def create_draft_model(mode, draft_llama=None, num_pred_tokens=8):
+    """按模式创建草稿模型：'prompt_lookup' 或 'draft'"""
+    if mode == "prompt_lookup":
+        # 宠物常复述主人的话，直接在上下文里查找 n-gram 作为草稿
+        draft = LlamaPromptLookupDecoding(num_pred_tokens=num_pred_tokens)
+    elif mode == "draft":
+        if draft_llama is None:
+            raise ValueError("draft 模式需要提供草稿模型")
+        draft = GGUFDraftModel(draft_llama, num_pred_tokens=num_pred_tokens)
+    else:
+        raise ValueError(f"未知的投机解码模式: {mode}")
+    return TrackingDraftModel(draft)
@@ -0,0 +1,86 @@
+import os
+from PyQt6.QtGui import QPixmap, QImage
+from PyQt6.QtCore import Qt
+
+# 动画名称与素材文件夹
+ANIMATION_FOLDERS = {
+    'idle': '01-Idle/01-Idle',
+    'idle_blink': '01-Idle/02-Idle_Blink',
+    'walk': '03-Walk/01-Walk',
+    'walk_happy': '03-Walk/02-Walk_Happy',
+    'run': '04-Run',
+    'jump_up': '06-Jump/01-Jump_Up',
+    'jump_fall': '06-Jump/02-Jump_Fall',
+    'jump_throw': '06-Jump/03-Jump_Throw',
+    'hurt': '07-Hurt/01-Hurt',
+    'hurt_dizzy': '07-Hurt/02-Hurt_Dizzy',
+    'throw': '02-Throw',
+    'dead': '08-Dead'
+}
+
+# 皮肤名称与素材根目录，各皮肤的子文件夹结构相同
+SKINS = {
+    'panda': 'assets/Animation PNG/PANDA/NUDE',
+    'teddy': 'assets/TEDDY',
+}
+DEFAULT_SKIN = 'panda'
+
+PET_SIZE = 100  # 宠物窗口的逻辑尺寸（与缩放比例无关）
+
+class SpriteRepository:
+    """所有宠物共用的动画帧，按 (皮肤, 设备像素比) 各保存一份
+
+    同一皮肤的宠物拿到的是同一个字典，新增一只宠物不会再复制一遍像素数据。
+    """
+    def __init__(self):
+        self.frame_sets = {}  # (皮肤, 设备像素比) -> {动画名: 帧列表}
+        self.images = {}  # 其他共用的图片（如背景），路径 -> QPixmap
+
+    def animations(self, skin, dpr):
+        """返回该皮肤和缩放比例的帧集（可能还未加载完）"""
+        return self.frame_sets.setdefault((skin, dpr), {})
+
+    def load(self, skin, dpr, names=None):
+        """加载帧集中尚未加载的动画，names 为None时加载全部"""
+        animations = self.animations(skin, dpr)
+        for name in names or ANIMATION_FOLDERS:
+            if name not in animations:
+                animations[name] = self.load_frames(skin, ANIMATION_FOLDERS[name], dpr)
+        return animations
+
+    def load_frames(self, skin, folder, dpr):
+        """加载指定文件夹中的所有动画帧
+
+        按设备像素比缩放到物理像素，并预先转换为预乘透明格式，
+        绘制时不再需要缩放和格式转换。
+        """
+        frames = []
+        base_path = os.path.join(SKINS.get(skin, SKINS[DEFAULT_SKIN]), folder)
+        size = round(PET_SIZE * dpr)
+        try:
+            files = sorted(os.listdir(base_path))
+            for file in files:
+                if file.endswith('.png'):
+                    image = QImage(os.path.join(base_path, file)).scaled(
+                        size, size, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
+                    pixmap = QPixmap.fromImage(image.convertToFormat(QImage.Format.Format_ARGB32_Premultiplied))
+                    pixmap.setDevicePixelRatio(dpr)
+                    frames.append(pixmap)
+        except Exception as e:
+            print(f"加载动画帧错误 {folder}: {e}")
+        return frames
+
+    def pixmap(self, path):
+        """加载并缓存一张共用图片"""
+        if path not in self.images:
+            self.images[path] = QPixmap.fromImage(QImage(path))
+        return self.images[path]
+
+    def memory_bytes(self):
+        """已加载的所有帧占用的像素内存"""
+        frames = [p for animations in self.frame_sets.values()
+                  for frames in animations.values() for p in frames]
+        return sum(p.width() * p.height() * p.depth() // 8 for p in frames + list(self.images.values()))
+
+# 全局共享的动画帧
+sprites = SpriteRepository()
@@ -0,0 +1,73 @@
+from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QTableWidget, QTableWidgetItem,
+                           QPushButton, QLabel, QHeaderView)
+from PyQt6.QtCore import QTimer
+from tracing import tracer
+
+# 面板中各阶段的显示顺序和名称
+SPAN_LABELS = [
+    ("capture", "录音"),
+    ("stt", "语音识别"),
+    ("audio_saved_s", "预处理裁掉的音频 (s)"),
+    ("prompt_build", "构建提示"),
+    ("prefill", "预填充"),
+    ("first_token", "首token"),
+    ("ttft_ms", "首token延迟"),
+    ("decode", "解码"),
+    ("decode_tps", "解码速度 (tok/s)"),
+    ("tokens", "生成token数"),
+    ("tts", "语音合成"),
+    ("first_audio", "首次出声"),
+    ("playback", "播放"),
+    ("total_ms", "总耗时"),
+]
+
+class TracePanel(QWidget):
+    """调试面板：显示最近各阶段耗时的 p50/p95"""
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle('性能面板')
+        self.resize(420, 480)
+
+        layout = QVBoxLayout(self)
+        self.summary = QLabel()
+        layout.addWidget(self.summary)
+
+        self.table = QTableWidget(0, 4)
+        self.table.setHorizontalHeaderLabels(["阶段", "次数", "p50 (ms)", "p95 (ms)"])
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        self.table.verticalHeader().setVisible(False)
+        layout.addWidget(self.table)
+
+        buttons = QHBoxLayout()
+        export_button = QPushButton('导出JSONL')
+        export_button.clicked.connect(self.export)
+        buttons.addStretch(1)
+        buttons.addWidget(export_button)
+        layout.addLayout(buttons)
+
+        # 每秒刷新
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.refresh_timer.start(1000)
+        self.refresh()
+
+    def refresh(self):
+        """刷新统计数据"""
+        stats = tracer.stats()
+        rows = [(label, stats[name]) for name, label in SPAN_LABELS if name in stats]
+        # 未预定义的阶段放在最后
+        known = {name for name, _ in SPAN_LABELS}
+        rows.extend((name, value) for name, value in sorted(stats.items()) if name not in known)
+
+        self.table.setRowCount(len(rows))
+        for row, (label, value) in enumerate(rows):
+            self.table.setItem(row, 0, QTableWidgetItem(label))
+            self.table.setItem(row, 1, QTableWidgetItem(str(value["count"])))
+            self.table.setItem(row, 2, QTableWidgetItem(f"{value['p50']:.1f}"))
+            self.table.setItem(row, 3, QTableWidgetItem(f"{value['p95']:.1f}"))
+        self.summary.setText(f"最近 {len(tracer.turns)} 轮对话")
+
+    def export(self):
+        """导出当前缓冲区的记录"""
+        path = tracer.export_jsonl()
+        self.summary.setText(f"已导出到 {path}")
@@ -0,0 +1,98 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+class Turn:
+    """一轮对话（文字或语音）的各阶段耗时"""
+    def __init__(self, kind):
+        self.kind = kind
+        self.time = time.time()
+        self.start = time.perf_counter()
+        self.spans = {}    # 阶段名 -> 耗时(ms)
+        self.metrics = {}  # 其他指标，如 tokens/s、路由
+
+    @contextmanager
+    def span(self, name):
+        """记录一个阶段的耗时"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - start) * 1000)
+
+    def record(self, name, ms):
+        """直接记录一个阶段的耗时（同名阶段累加）"""
+        self.spans[name] = self.spans.get(name, 0.0) + ms
+
+    def mark(self, name):
+        """记录从本轮开始到现在的时间，如首次出声"""
+        self.spans[name] = (time.perf_counter() - self.start) * 1000
+
+    def set(self, name, value):
+        self.metrics[name] = value
+
+    def to_dict(self):
+        return {
+            "kind": self.kind,
+            "time": self.time,
+            "total_ms": (time.perf_counter() - self.start) * 1000,
+            "spans": self.spans,
+            "metrics": self.metrics,
+        }
+
+def percentile(values, p):
+    """最近邻法百分位数"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+class Tracer:
+    """保存最近若干轮的耗时记录（环形缓冲），可导出为JSONL并统计p50/p95"""
+    def __init__(self, capacity=1000):
+        self.turns = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+
+    def start_turn(self, kind="chat"):
+        return Turn(kind)
+
+    def finish(self, turn):
+        """结束一轮并放入缓冲区"""
+        record = turn.to_dict()
+        with self._lock:
+            self.turns.append(record)
+        return record
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.turns)
+
+    def stats(self):
+        """各阶段和数值指标的 p50/p95"""
+        values = {}
+        for record in self.snapshot():
+            values.setdefault("total_ms", []).append(record["total_ms"])
+            for name, ms in record["spans"].items():
+                values.setdefault(name, []).append(ms)
+            for name, value in record["metrics"].items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    values.setdefault(name, []).append(value)
+        return {name: {"count": len(v), "p50": percentile(v, 50), "p95": percentile(v, 95)}
+                for name, v in values.items()}
+
+    def export_jsonl(self, path=None):
+        """把缓冲区中的记录写成JSONL文件"""
+        if path is None:
+            path = os.path.join("logs", f"traces_{time.strftime('%Y%m%d%H%M%S')}.jsonl")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            for record in self.snapshot():
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return path
+
+# 全局默认的追踪器
+tracer = Tracer()
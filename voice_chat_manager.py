@@ -1,31 +1,33 @@
 import os
 import wave
-import pyaudio
 import threading
 import subprocess
 import asyncio
 import time
-from datetime import datetime
-import edge_tts
-from pydub import AudioSegment
-from pydub.playback import play
+from concurrent.futures import ThreadPoolExecutor
+from scratch_store import ScratchStore, load_scratch_config
 
 class VoiceChatManager:
-    def __init__(self):
+    def __init__(self, scratch=None):
         # 录音配置
         self.CHUNK = 1024
-        self.FORMAT = pyaudio.paInt16
+        self.SAMPLE_WIDTH = 2  # 16位采样（pyaudio 在录音时才导入）
         self.CHANNELS = 1
         self.RATE = 16000
         self.is_recording = False
         self.recording_thread = None
+        self.record_start_time = 0
+        self.last_capture_seconds = 0.0  # 上一次录音的时长
+        self.recording_file = None
+        self.last_audio_saved_seconds = 0.0  # 上一次识别时预处理裁掉的音频时长
         
         # whisper.cpp 配置
         self.whisper_path = "whisper.cpp/main.exe"
         self.whisper_model = "models/ggml-model-whisper-base.bin"
+        self.stt_workers = 2  # 长录音切段后并行运行的 whisper 进程数
         
-        # 创建临时文件夹
-        os.makedirs("temp", exist_ok=True)
+        # 录音和合成语音的临时文件，参数来自 llama_config.json 的 scratch 部分
+        self.scratch = scratch or ScratchStore(**load_scratch_config())
     
     def start_recording(self):
         """开始录音"""
@@ -33,6 +35,8 @@ class VoiceChatManager:
             return False
         
         self.is_recording = True
+        self.record_start_time = time.perf_counter()
+        self.recording_file = self.scratch.path("recording", ".wav")
         self.recording_thread = threading.Thread(target=self._record_audio)
         self.recording_thread.start()
         return True
@@ -44,16 +48,17 @@ class VoiceChatManager:
         
         self.is_recording = False
         self.recording_thread.join()
+        self.last_capture_seconds = time.perf_counter() - self.record_start_time
         
-        # 返回录音文件路径
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        return f"temp/recording_{timestamp}.wav"
+        # 返回录音线程写入的文件
+        return self.recording_file
     
     def _record_audio(self):
         """录音线程函数"""
+        import pyaudio
         p = pyaudio.PyAudio()
         
-        stream = p.open(format=self.FORMAT,
+        stream = p.open(format=p.get_format_from_width(self.SAMPLE_WIDTH),
                         channels=self.CHANNELS,
                         rate=self.RATE,
                         input=True,
@@ -74,12 +79,11 @@ class VoiceChatManager:
         p.terminate()
         
         # 保存录音文件
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        filename = f"temp/recording_{timestamp}.wav"
+        filename = self.recording_file
         
         wf = wave.open(filename, 'wb')
         wf.setnchannels(self.CHANNELS)
-        wf.setsampwidth(p.get_sample_size(self.FORMAT))
+        wf.setsampwidth(self.SAMPLE_WIDTH)
         wf.setframerate(self.RATE)
         wf.writeframes(b''.join(frames))
         wf.close()
@@ -87,7 +91,42 @@ class VoiceChatManager:
         return filename
     
     def speech_to_text(self, audio_file):
-        """使用 whisper.cpp 进行语音识别"""
+        """预处理录音后用 whisper.cpp 识别，长停顿切开的片段并行识别"""
+        from audio_preprocess import read_wav, write_wav, preprocess
+        self.last_audio_saved_seconds = 0.0
+        try:
+            samples, rate = read_wav(audio_file)
+            pieces, stats = preprocess(samples, rate)
+        except (wave.Error, ValueError, OSError) as e:
+            print(f"语音预处理失败，使用原始录音: {e}")
+            return self._transcribe(audio_file)
+        except Exception as e:
+            print(f"语音识别出错: {e}")
+            return None
+        
+        self.last_audio_saved_seconds = stats["saved_seconds"]
+        print(f"语音预处理: {stats['original_seconds']:.1f}秒 -> {stats['processed_seconds']:.1f}秒，"
+              f"节省 {stats['saved_seconds']:.1f}秒，共 {stats['segments']} 段")
+        if not pieces:
+            print("录音中没有检测到说话声")
+            return None
+        
+        segment_files = [self.scratch.path("segment", ".wav") for _ in pieces]
+        try:
+            for path, piece in zip(segment_files, pieces):
+                write_wav(path, piece, rate)
+            with ThreadPoolExecutor(max_workers=min(len(pieces), self.stt_workers)) as pool:
+                texts = [text for text in pool.map(self._transcribe, segment_files) if text]
+        except Exception as e:
+            print(f"语音识别出错: {e}")
+            return None
+        finally:
+            for path in segment_files:
+                self.scratch.release(path)
+        return "，".join(texts) if texts else None
+    
+    def _transcribe(self, audio_file):
+        """使用 whisper.cpp 识别一个音频文件"""
         try:
             # 调用 whisper.cpp 进行语音识别
             cmd = [
@@ -106,6 +145,7 @@ class VoiceChatManager:
             if os.path.exists(txt_file):
                 with open(txt_file, 'r', encoding='utf-8') as f:
                     text = f.read().strip()
+                os.remove(txt_file)
                 print(f"从文件读取识别结果: {text}")
                 return text
             
@@ -125,14 +165,14 @@ class VoiceChatManager:
     
     async def _generate_speech(self, text, output_file):
         """使用 edge-tts 生成语音"""
+        import edge_tts
         communicate = edge_tts.Communicate(text, "zh-CN-XiaoxiaoNeural")
         await communicate.save(output_file)
     
     def text_to_speech(self, text, output_file=None):
         """将文字转为语音"""
         if not output_file:
-            timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-            output_file = f"temp/speech_{timestamp}.mp3"
+            output_file = self.scratch.path("speech", ".mp3")
         
         # 使用 asyncio 运行异步函数
         loop = asyncio.new_event_loop()
@@ -144,13 +184,21 @@ class VoiceChatManager:
         
         return output_file
     
-    def play_audio(self, audio_file):
-        """播放音频文件"""
+    def play_audio(self, audio_file, on_start=None):
+        """播放音频文件
+
+        on_start: 解码完成、真正开始出声时调用，用于统计首次出声的时间
+        返回True表示已在本进程播放完毕；交给系统播放器（不等待其结束）或失败时返回False
+        """
         try:
             print(f"开始播放音频: {audio_file}")
             
             # 加载并播放音频
+            from pydub import AudioSegment
+            from pydub.playback import play
             sound = AudioSegment.from_file(audio_file)
+            if on_start:
+                on_start()
             play(sound)
             
             print(f"音频播放完成: {audio_file}")
@@ -160,11 +208,13 @@ class VoiceChatManager:
             
             # 如果pydub失败，尝试使用系统命令
             try:
+                if on_start:
+                    on_start()
                 if os.name == 'nt':  # Windows
                     os.system(f'start {audio_file}')
                 else:  # Linux/Mac
                     os.system(f'xdg-open {audio_file}')
-                return True
+                return False
             except Exception as e2:
                 print(f"使用系统命令播放也失败: {e2}")
                 return False 
\ No newline at end of file